@@ -0,0 +1,171 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+import sys
+import time
+try:
+  import resource
+except ImportError:
+  resource = None
+
+##############################################################################
+# Budgets and results
+##############################################################################
+
+# A proof search ends in one of three ways: the formula is proven, the
+# search runs out of sequents (so it is unprovable), or a budget runs out
+# first and the answer is unknown.
+PROVEN = 'proven'
+UNPROVABLE = 'unprovable'
+UNKNOWN = 'unknown'
+
+# Every limit is optional: steps is the number of sequents expanded plus the
+# number of unification attempts made while searching for a unifier that
+# closes a sibling group (so that one step cannot run unbounded), seconds
+# is wall-clock time, frontier is the number of sequents waiting to be
+# expanded (not counting those whose sibling group is already closed, though
+# a sequent equal to one proven elsewhere counts until it is taken out and
+# skipped), and memory is the resident size of the process in bytes. Memory
+# is only sampled every memory_interval steps, and is ignored where it
+# cannot be measured.
+class Budget:
+  def __init__(self, steps=None, seconds=None, frontier=None, memory=None,
+    memory_interval=64):
+    self.steps = steps
+    self.seconds = seconds
+    self.frontier = frontier
+    self.memory = memory
+    self.memory_interval = memory_interval
+
+  def __str__(self):
+    limits = ['%s=%s' % (name, getattr(self, name))
+      for name in ('steps', 'seconds', 'frontier', 'memory')
+      if getattr(self, name) is not None]
+    return 'Budget(%s)' % ', '.join(limits)
+
+  # a budget with the tighter of this budget's limits and another's (which
+  # may be None)
+  def tighter(self, other):
+    if other is None:
+      return self
+    limits = { }
+    for name in ('steps', 'seconds', 'frontier', 'memory'):
+      values = [value for value in (getattr(self, name), getattr(other, name))
+        if value is not None]
+      limits[name] = min(values) if len(values) > 0 else None
+    return Budget(memory_interval=min(self.memory_interval,
+      other.memory_interval), **limits)
+
+  # the budget left after a search with the given stats (see Result)
+  def remaining(self, stats):
+    steps = self.steps
+    if steps is not None:
+      steps = max(steps - stats['steps'] - stats.get('unifications', 0), 0)
+    seconds = self.seconds
+    if seconds is not None:
+      seconds = max(seconds - stats['seconds'], 0.0)
+    return Budget(steps, seconds, self.frontier, self.memory,
+      self.memory_interval)
+
+# the resident size of the process in bytes, or None if it is unknown
+def residentMemory():
+  if resource is None:
+    return None
+  try:
+    with open('/proc/self/statm') as statm:
+      return int(statm.read().split()[1]) * resource.getpagesize()
+  except (IOError, OSError, ValueError, IndexError):
+    pass
+
+  # elsewhere only the peak is available (in bytes on macOS, in kilobytes
+  # on other systems)
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    return peak
+  return peak * 1024
+
+# A result is true only if the formula was proven. When a budget ran out,
+# reason names the limit that was hit. stats holds the steps taken, the
+# seconds elapsed, the unification attempts, the largest frontier seen, the
+# last memory sample and the number of iterative deepening rounds (and
+# relevant, the number of
+# axioms a relevance filter selected, if one was used). A proof also
+# reports the formulae on the left of the proven sequent that it used (used
+# is None when this is not known). An unprovable result may come with a
+# counterexample: a map from atoms to truth values (see sat.py).
+class Result:
+  def __init__(self, status, stats, reason=None, used=None):
+    self.status = status
+    self.stats = stats
+    self.reason = reason
+    self.used = used
+    self.counterexample = None
+
+  def __bool__(self):
+    return self.status == PROVEN
+
+  def __str__(self):
+    if self.reason is None:
+      return self.status
+    return '%s (%s budget exhausted)' % (self.status, self.reason)
+
+# A meter counts the work done by one search and checks it against a
+# budget (which may be None).
+class Meter:
+  def __init__(self, budget=None):
+    self.budget = budget
+    self.start = time.monotonic()
+    self.steps = 0
+    self.unifications = 0
+    self.max_frontier = 0
+    self.memory = None
+    self.rounds = 1
+
+  # called before expanding a sequent; returns the name of the exhausted
+  # limit, or None (and counts the step) if the sequent may be expanded
+  def step(self, frontier_size):
+    if frontier_size > self.max_frontier:
+      self.max_frontier = frontier_size
+    budget = self.budget
+    if budget is not None:
+      if budget.steps is not None and \
+        self.steps + self.unifications >= budget.steps:
+        return 'steps'
+      if budget.seconds is not None and \
+        time.monotonic() - self.start > budget.seconds:
+        return 'seconds'
+      if budget.frontier is not None and frontier_size > budget.frontier:
+        return 'frontier'
+      if budget.memory is not None and \
+        self.steps % budget.memory_interval == 0:
+        self.memory = residentMemory()
+        if self.memory is not None and self.memory > budget.memory:
+          return 'memory'
+    self.steps += 1
+    return None
+
+  # called before a unification attempt; returns the name of the exhausted
+  # limit, or None (and counts the attempt) if it may be made
+  def attempt(self):
+    budget = self.budget
+    if budget is not None:
+      if budget.steps is not None and \
+        self.steps + self.unifications >= budget.steps:
+        return 'steps'
+      if budget.seconds is not None and \
+        time.monotonic() - self.start > budget.seconds:
+        return 'seconds'
+    self.unifications += 1
+    return None
+
+  def result(self, status, reason=None, used=None):
+    return Result(status, {
+      'steps': self.steps,
+      'seconds': time.monotonic() - self.start,
+      'unifications': self.unifications,
+      'frontier': self.max_frontier,
+      'memory': self.memory,
+      'rounds': self.rounds
+    }, reason, used)
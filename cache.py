@@ -0,0 +1,151 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+import hashlib
+import json
+import sqlite3
+import time
+from budget import *
+from canonical import formulaKey
+
+##############################################################################
+# Proof cache
+##############################################################################
+
+# A proof cache remembers the result of each problem (a set of axioms and a
+# formula) in an SQLite database, so a problem that was already settled is
+# answered without searching again. The database is in write-ahead logging
+# mode, so several processes can share it: readers do not block the writer,
+# and a writer waits for another one to finish. When the cache holds more
+# than max_entries results, the least recently used ones are evicted.
+#
+# Proven and unprovable results hold for any budget. An unknown result is
+# stored with the budget it ran out of, and is only returned for a search
+# with no larger limits (otherwise the search is worth running again).
+#
+# A proof also stores the canonical keys of the axioms it used, so a cached
+# proof reports them (as the caller's own axioms) like a fresh one.
+
+# the key of a problem (the order of the axioms, the names of bound
+# variables and the order of conjuncts and disjuncts do not matter; see
+# canonical.py)
+def problemKey(axioms, formula):
+  return keyedProblemKey(axiomKeys(axioms), formula)
+
+# the axioms by their canonical keys
+def axiomKeys(axioms):
+  keys = { }
+  for axiom in axioms:
+    keys.setdefault(formulaKey(axiom), axiom)
+  return keys
+
+def keyedProblemKey(keys, formula):
+  text = '\n'.join(sorted(keys))
+  text += '\n⊢\n' + formulaKey(formula)
+  return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+BUDGET_LIMITS = ('steps', 'seconds', 'frontier', 'memory')
+
+def budgetLimits(budget):
+  if budget is None:
+    return { }
+  return { name: getattr(budget, name) for name in BUDGET_LIMITS
+    if getattr(budget, name) is not None }
+
+# whether a search under the budget can do no more than one under the
+# limits (a missing limit is unbounded)
+def withinLimits(budget, limits):
+  requested = budgetLimits(budget)
+  for name, limit in limits.items():
+    if name not in requested or requested[name] > limit:
+      return False
+  return True
+
+class ProofCache:
+  def __init__(self, path, max_entries=100000):
+    self.max_entries = max_entries
+    self.connection = sqlite3.connect(path, timeout=60,
+      isolation_level=None)
+    self.connection.execute('PRAGMA journal_mode=WAL')
+    self.connection.execute('PRAGMA synchronous=NORMAL')
+    self.connection.execute('''
+      CREATE TABLE IF NOT EXISTS results (
+        key TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        reason TEXT,
+        steps INTEGER NOT NULL,
+        seconds REAL NOT NULL,
+        budget TEXT,
+        used REAL NOT NULL,
+        dependencies TEXT
+      )
+    ''')
+
+    # databases made before dependencies were stored lack the column
+    columns = [row[1] for row in
+      self.connection.execute('PRAGMA table_info(results)')]
+    if 'dependencies' not in columns:
+      self.connection.execute(
+        'ALTER TABLE results ADD COLUMN dependencies TEXT')
+    self.connection.execute(
+      'CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+
+  def close(self):
+    self.connection.close()
+
+  def __len__(self):
+    return self.connection.execute(
+      'SELECT COUNT(*) FROM results').fetchone()[0]
+
+  # the cached result of a problem, or None
+  def get(self, axioms, formula, budget=None):
+    keys = axiomKeys(axioms)
+    key = keyedProblemKey(keys, formula)
+    row = self.connection.execute(
+      'SELECT status, reason, steps, seconds, budget, dependencies ' \
+      'FROM results WHERE key = ?', (key,)).fetchone()
+    if row is None:
+      return None
+    status, reason, steps, seconds, limits, dependencies = row
+    if status == UNKNOWN and not withinLimits(budget, json.loads(limits)):
+      return None
+    self.connection.execute('UPDATE results SET used = ? WHERE key = ?',
+      (time.time(), key))
+    used = None
+    if dependencies is not None:
+      used = frozenset([keys[axiom_key]
+        for axiom_key in json.loads(dependencies)])
+    return Result(status, {
+      'steps': steps,
+      'seconds': seconds,
+      'frontier': None,
+      'memory': None,
+      'rounds': None,
+      'cached': True
+    }, reason, used)
+
+  # remember a result found with the given budget
+  def put(self, axioms, formula, result, budget=None):
+    limits = None
+    if result.status == UNKNOWN:
+      limits = json.dumps(budgetLimits(budget))
+    dependencies = None
+    if result.used is not None:
+      dependencies = json.dumps(sorted(set([formulaKey(axiom)
+        for axiom in result.used])))
+    with self.connection:
+      self.connection.execute('BEGIN IMMEDIATE')
+      self.connection.execute(
+        'INSERT OR REPLACE INTO results ' \
+        '(key, status, reason, steps, seconds, budget, used, ' \
+        'dependencies) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (problemKey(axioms, formula), result.status, result.reason,
+          result.stats['steps'], result.stats['seconds'], limits,
+          time.time(), dependencies))
+      excess = len(self) - self.max_entries
+      if excess > 0:
+        self.connection.execute(
+          'DELETE FROM results WHERE key IN ' \
+          '(SELECT key FROM results ORDER BY used LIMIT ?)', (excess,))
@@ -0,0 +1,146 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+import hashlib
+from language import *
+
+##############################################################################
+# Canonical forms
+##############################################################################
+
+# Formulae that differ only in the names of their bound variables, or in the
+# numbering of the fresh symbols the prover made up, are equivalent, but
+# they are different nodes. A canonical form writes bound variables as de
+# Bruijn indices (#0 is the innermost binder) and renumbers fresh symbols in
+# the order they are met, so all such formulae get the same text. With ac
+# set, nested conjunctions (and disjunctions) are also flattened and their
+# operands sorted, so the order and grouping of operands do not matter.
+#
+# Operands and formulae are sorted by their shape: their text with every
+# fresh symbol written as ?, which does not depend on the numbering. Fresh
+# symbols are then numbered in that order. Two formulae with the same shape
+# may still be numbered differently depending on the order they were given
+# in, so equal keys always mean equivalent formulae, but equivalent formulae
+# do not always get equal keys.
+#
+# Only unification terms and the variables named in fresh are renamed.
+# Other free variables stand for constants given by the user, so they are
+# kept as they are.
+
+class Canonicalizer:
+  def __init__(self, fresh=(), ac=True):
+    # the names of the fresh variables (the set may grow later)
+    self.fresh = fresh
+    self.ac = ac
+
+    # the shapes of the closed formulae seen so far
+    self.shapes = { }
+
+  # the text of a node, where names maps the fresh symbols met so far to
+  # their numbers (or is None for the shape)
+  def text(self, node, bound, names):
+    if isinstance(node, Variable):
+      for i in range(len(bound)):
+        if bound[-1 - i] == node:
+          return '#%d' % i
+      if node.name not in self.fresh:
+        return 'x' + node.name
+      return self.number(node, 'v', names)
+    if isinstance(node, UnificationTerm):
+      return self.number(node, 't', names)
+    if isinstance(node, Function):
+      return 'f%s(%s)' % (node.name,
+        ','.join([self.text(term, bound, names) for term in node.terms]))
+    if isinstance(node, Predicate):
+      return 'p%s(%s)' % (node.name,
+        ','.join([self.text(term, bound, names) for term in node.terms]))
+    if isinstance(node, Not):
+      return '~' + self.text(node.formula, bound, names)
+    if isinstance(node, And) or isinstance(node, Or):
+      symbol = '&' if isinstance(node, And) else '|'
+      if not self.ac:
+        return '%s(%s,%s)' % (symbol,
+          self.text(node.formula_a, bound, names),
+          self.text(node.formula_b, bound, names))
+      operands = []
+      self.flatten(node, type(node), operands)
+      if names is None:
+        texts = sorted([self.text(operand, bound, None)
+          for operand in operands])
+      else:
+        operands.sort(key=lambda operand: self.text(operand, bound, None))
+        texts = [self.text(operand, bound, names) for operand in operands]
+      return '%s(%s)' % (symbol, ','.join(texts))
+    if isinstance(node, Implies):
+      return '>(%s,%s)' % (self.text(node.formula_a, bound, names),
+        self.text(node.formula_b, bound, names))
+    if isinstance(node, ForAll) or isinstance(node, ThereExists):
+      symbol = 'A' if isinstance(node, ForAll) else 'E'
+      return symbol + '.' + self.text(node.formula, bound + [node.variable],
+        names)
+    raise TypeError('not a term or formula: %s' % node)
+
+  def number(self, node, prefix, names):
+    if names is None:
+      return '?'
+    if node not in names:
+      names[node] = '%s%d' % (prefix, len(names))
+    return names[node]
+
+  def flatten(self, node, kind, operands):
+    if isinstance(node, kind):
+      self.flatten(node.formula_a, kind, operands)
+      self.flatten(node.formula_b, kind, operands)
+    else:
+      operands.append(node)
+
+  # the text of a formula with every fresh symbol written as ?
+  def shape(self, formula):
+    shape = self.shapes.get(formula)
+    if shape is None:
+      shape = self.text(formula, [], None)
+      if not self.hasFresh(formula):
+        self.shapes[formula] = shape
+    return shape
+
+  def hasFresh(self, formula):
+    if len(formula.freeUnificationTerms()) > 0:
+      return True
+    for variable in formula.freeVariables():
+      if variable.name in self.fresh:
+        return True
+    return False
+
+  def formulaText(self, formula, names):
+    if not self.hasFresh(formula):
+      return self.shape(formula)
+    return self.text(formula, [], names)
+
+  # a key which is the same for equivalent formulae
+  def formulaKey(self, formula):
+    return digest(self.formulaText(formula, { }))
+
+  # a key which is the same for equivalent sequents (the fresh symbols are
+  # numbered across the whole sequent)
+  # label(side, formula), if given, is a string added to each formula's text
+  def sequentKey(self, left, right, label=None):
+    names = { }
+    sides = [ ]
+    for side, formulas in (('left', left), ('right', right)):
+      texts = [ ]
+      for formula in sorted(formulas, key=self.shape):
+        text = self.formulaText(formula, names)
+        if label is not None:
+          text += '@' + label(side, formula)
+        texts.append(text)
+      sides.append('\n'.join(sorted(texts)))
+    return digest(sides[0] + '\n⊢\n' + sides[1])
+
+def digest(text):
+  return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+# the canonical key of a formula given by the user
+def formulaKey(formula, ac=True):
+  return Canonicalizer(ac=ac).formulaKey(formula)
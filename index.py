@@ -0,0 +1,160 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+from language import *
+from pmap import PersistentMap
+
+##############################################################################
+# Discrimination trees
+##############################################################################
+
+# A discrimination tree indexes atomic formulae by the preorder sequence of
+# their symbols. Function and predicate symbols are keyed on their name and
+# arity, variables on themselves, and every unification term on the
+# wildcard STAR. Retrieval walks the query and the tree together, letting a
+# wildcard on either side skip a whole subterm on the other, so it returns a
+# superset of the indexed formulae that unify with the query (the occurs and
+# time checks are left to the unifier).
+
+STAR = '*'
+
+# The tree is persistent: a node's children and formulae are persistent
+# maps, and inserting or deleting a formula copies only the nodes on its
+# path, so a tree can be shared by many owners that each extend it
+# separately (as sequents share theirs with their parents).
+class IndexNode:
+  __slots__ = ('children', 'formulas')
+
+  def __init__(self, children, formulas):
+    self.children = children
+    self.formulas = formulas
+
+EMPTY_INDEX_NODE = IndexNode(PersistentMap(), PersistentMap())
+
+# preorder symbol keys of a term
+def flatten(term, keys):
+  if isinstance(term, UnificationTerm):
+    keys.append(STAR)
+  elif isinstance(term, Variable):
+    keys.append(term)
+  else:
+    terms = term.terms
+    keys.append((term.name, len(terms)))
+    for subterm in terms:
+      flatten(subterm, keys)
+  return keys
+
+# number of subterms that follow a key in preorder
+def arity(key):
+  if isinstance(key, tuple):
+    return key[1]
+  return 0
+
+# the node with the formula added below it along the keys
+def insertPath(node, keys, position, formula):
+  if position == len(keys):
+    if formula in node.formulas:
+      return node
+    return IndexNode(node.children, node.formulas.set(formula, None))
+  key = keys[position]
+  child = node.children.get(key, EMPTY_INDEX_NODE)
+  new_child = insertPath(child, keys, position + 1, formula)
+  if new_child is child:
+    return node
+  return IndexNode(node.children.set(key, new_child), node.formulas)
+
+# the node with the formula removed below it along the keys (None if the
+# node became empty)
+def deletePath(node, keys, position, formula):
+  if position == len(keys):
+    if formula not in node.formulas:
+      return node
+    formulas = node.formulas.delete(formula)
+    if len(formulas) == 0 and len(node.children) == 0:
+      return None
+    return IndexNode(node.children, formulas)
+  key = keys[position]
+  child = node.children.get(key)
+  if child is None:
+    return node
+  new_child = deletePath(child, keys, position + 1, formula)
+  if new_child is child:
+    return node
+  if new_child is None:
+    children = node.children.delete(key)
+    if len(children) == 0 and len(node.formulas) == 0:
+      return None
+    return IndexNode(children, node.formulas)
+  return IndexNode(node.children.set(key, new_child), node.formulas)
+
+class DiscriminationTree:
+  def __init__(self, root=EMPTY_INDEX_NODE, size=0):
+    self.root = root
+    self.size = size
+
+  def __len__(self):
+    return self.size
+
+  # a tree with the formula added
+  def insert(self, formula):
+    if not isinstance(formula, Predicate):
+      return self
+    root = insertPath(self.root, flatten(formula, []), 0, formula)
+    if root is self.root:
+      return self
+    return DiscriminationTree(root, self.size + 1)
+
+  # a tree without the formula
+  def delete(self, formula):
+    if not isinstance(formula, Predicate):
+      return self
+    root = deletePath(self.root, flatten(formula, []), 0, formula)
+    if root is self.root:
+      return self
+    return DiscriminationTree(root or EMPTY_INDEX_NODE, self.size - 1)
+
+  # all indexed formulae that might unify with the query
+  def unifiable(self, formula):
+    if not isinstance(formula, Predicate):
+      return []
+    keys = flatten(formula, [])
+
+    # ends[i] is the position just past the subterm that starts at i
+    ends = [0] * len(keys)
+    stack = []
+    for i in range(len(keys) - 1, -1, -1):
+      end = i + 1
+      for j in range(arity(keys[i])):
+        end = stack.pop()
+      ends[i] = end
+      stack.append(end)
+
+    results = []
+    self.retrieve(self.root, keys, ends, 0, results)
+    return results
+
+  def retrieve(self, node, keys, ends, position, results):
+    if position == len(keys):
+      results.extend(node.formulas.keys())
+      return
+    key = keys[position]
+    if key is STAR:
+      for child in self.skip(node, 1):
+        self.retrieve(child, keys, ends, position + 1, results)
+      return
+    child = node.children.get(key)
+    if child is not None:
+      self.retrieve(child, keys, ends, position + 1, results)
+    child = node.children.get(STAR)
+    if child is not None:
+      self.retrieve(child, keys, ends, ends[position], results)
+
+  # the nodes reached by skipping a number of whole subterms in the tree
+  def skip(self, node, count):
+    if count == 0:
+      yield node
+      return
+    for key, child in node.children.items():
+      yield from self.skip(child, count - 1 + arity(key))
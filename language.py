@@ -3,22 +3,102 @@
 
 # 2014 Stephan Boyer
 
-from functools import reduce
+from weakref import WeakValueDictionary
+from zlib import crc32
+
+##############################################################################
+# Hash consing
+##############################################################################
+
+# every term and formula is interned: constructing a node that is
+# structurally equal to a live node returns the existing object, so nodes
+# are immutable, equality is an identity check and the hash is computed once
+_nodes = WeakValueDictionary()
+
+# string hashes are salted per process, so names are hashed with crc32 to
+# keep node hashes (and therefore iteration orders) stable across runs
+_name_hashes = { }
+
+def _hashName(name):
+  result = _name_hashes.get(name)
+  if result is None:
+    result = crc32(name.encode('utf-8'))
+    _name_hashes[name] = result
+  return result
+
+def _makeNode(cls, key, hash_value, **fields):
+  node = object.__new__(cls)
+  for field, value in fields.items():
+    object.__setattr__(node, field, value)
+  object.__setattr__(node, 'hash', hash_value)
+  _nodes[key] = node
+  return node
+
+# free variable and unification term summaries are frozensets built once per
+# node; a union reuses a child's set whenever it already covers the others
+_empty = frozenset()
+
+def _union(sets):
+  result = _empty
+  for summary in sets:
+    if not result:
+      result = summary
+    elif summary and not summary <= result:
+      result = result | summary
+  return result
+
+# replacing a variable or unification term leaves a node unchanged unless
+# the term occurs free in it
+def _unchanged(node, old):
+  return isinstance(old, (Variable, UnificationTerm)) and \
+    old not in node.free_variables and \
+    old not in node.free_unification_terms
+
+class Node:
+  __slots__ = ()
+
+  def __setattr__(self, name, value):
+    raise AttributeError('%s is immutable' % type(self).__name__)
+
+  def __delattr__(self, name):
+    raise AttributeError('%s is immutable' % type(self).__name__)
+
+  def __eq__(self, other):
+    return self is other
+
+  def __ne__(self, other):
+    return self is not other
+
+  def __hash__(self):
+    return self.hash
+
+  # a node is ground when it contains no unification terms, so unification
+  # can only succeed against the very same node
+  def isGround(self):
+    return not self.free_unification_terms
 
 ##############################################################################
 # Terms
 ##############################################################################
 
-class Variable:
-  def __init__(self, name):
-    self.name = name
-    self.time = 0
+class Variable(Node):
+  __slots__ = ('name', 'time', 'free_variables', 'free_unification_terms',
+    'hash', '__weakref__')
+
+  def __new__(cls, name, time=0):
+    key = (cls, name, time)
+    node = _nodes.get(key)
+    if node is None:
+      node = _makeNode(cls, key, hash((1, _hashName(name), time)),
+        name=name, time=time, free_unification_terms=_empty)
+      object.__setattr__(node, 'free_variables', frozenset({ node }))
+    return node
 
   def freeVariables(self):
-    return { self }
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    return set()
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
@@ -28,30 +108,30 @@ class Variable:
   def occurs(self, unification_term):
     return False
 
-  def setInstantiationTime(self, time):
-    self.time = time
-
-  def __eq__(self, other):
-    if not isinstance(other, Variable):
-      return False
-    return self.name == other.name
-
   def __str__(self):
     return self.name
 
-  def __hash__(self):
-    return hash(str(self))
+  def __reduce__(self):
+    return (Variable, (self.name, self.time))
 
-class UnificationTerm:
-  def __init__(self, name):
-    self.name = name
-    self.time = 0
+class UnificationTerm(Node):
+  __slots__ = ('name', 'time', 'free_variables', 'free_unification_terms',
+    'hash', '__weakref__')
+
+  def __new__(cls, name, time=0):
+    key = (cls, name, time)
+    node = _nodes.get(key)
+    if node is None:
+      node = _makeNode(cls, key, hash((2, _hashName(name), time)),
+        name=name, time=time, free_variables=_empty)
+      object.__setattr__(node, 'free_unification_terms', frozenset({ node }))
+    return node
 
   def freeVariables(self):
-    return set()
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    return { self }
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
@@ -59,65 +139,51 @@ class UnificationTerm:
     return self
 
   def occurs(self, unification_term):
-    return self == unification_term
-
-  def setInstantiationTime(self, time):
-    self.time = time
-
-  def __eq__(self, other):
-    if not isinstance(other, UnificationTerm):
-      return False
-    return self.name == other.name
+    return self is unification_term
 
   def __str__(self):
     return self.name
 
-  def __hash__(self):
-    return hash(str(self))
-
-class Function:
-  def __init__(self, name, terms):
-    self.name = name
-    self.terms = terms
-    self.time = 0
+  def __reduce__(self):
+    return (UnificationTerm, (self.name, self.time))
+
+class Function(Node):
+  __slots__ = ('name', 'terms', 'time', 'free_variables',
+    'free_unification_terms', 'hash', '__weakref__')
+
+  def __new__(cls, name, terms):
+    terms = tuple(terms)
+    key = (cls, name) + terms
+    node = _nodes.get(key)
+    if node is None:
+      node = _makeNode(cls, key, hash((3, _hashName(name)) +
+        tuple([term.hash for term in terms])),
+        name=name,
+        terms=terms,
+        time=max([term.time for term in terms], default=0),
+        free_variables=_union([term.free_variables for term in terms]),
+        free_unification_terms=_union(
+          [term.free_unification_terms for term in terms])
+      )
+    return node
 
   def freeVariables(self):
-    if len(self.terms) == 0:
-      return set()
-    return reduce((lambda x, y: x | y),
-      [term.freeVariables() for term in self.terms])
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    if len(self.terms) == 0:
-      return set()
-    return reduce((lambda x, y: x | y),
-      [term.freeUnificationTerms() for term in self.terms])
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
       return new
+    if _unchanged(self, old):
+      return self
     return Function(self.name,
       [term.replace(old, new) for term in self.terms]
     )
 
   def occurs(self, unification_term):
-    return any([term.occurs(unification_term) for term in self.terms])
-
-  def setInstantiationTime(self, time):
-    self.time = time
-    for term in self.terms:
-      term.setInstantiationTime(time)
-
-  def __eq__(self, other):
-    if not isinstance(other, Function):
-      return False
-    if self.name != other.name:
-      return False
-    if len(self.terms) != len(other.terms):
-      return False
-    return all(
-      [self.terms[i] == other.terms[i] for i in range(len(self.terms))]
-    )
+    return unification_term in self.free_unification_terms
 
   def __str__(self):
     if len(self.terms) == 0:
@@ -126,54 +192,49 @@ class Function:
       [str(term) for term in self.terms]
     ) + ')'
 
-  def __hash__(self):
-    return hash(str(self))
+  def __reduce__(self):
+    return (Function, (self.name, self.terms))
 
 ##############################################################################
 # Formulae
 ##############################################################################
 
-class Predicate:
-  def __init__(self, name, terms):
-    self.name = name
-    self.terms = terms
+class Predicate(Node):
+  __slots__ = ('name', 'terms', 'free_variables', 'free_unification_terms',
+    'hash', '__weakref__')
+
+  def __new__(cls, name, terms):
+    terms = tuple(terms)
+    key = (cls, name) + terms
+    node = _nodes.get(key)
+    if node is None:
+      node = _makeNode(cls, key, hash((4, _hashName(name)) +
+        tuple([term.hash for term in terms])),
+        name=name,
+        terms=terms,
+        free_variables=_union([term.free_variables for term in terms]),
+        free_unification_terms=_union(
+          [term.free_unification_terms for term in terms])
+      )
+    return node
 
   def freeVariables(self):
-    if len(self.terms) == 0:
-      return set()
-    return reduce((lambda x, y: x | y),
-      [term.freeVariables() for term in self.terms])
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    if len(self.terms) == 0:
-      return set()
-    return reduce((lambda x, y: x | y),
-      [term.freeUnificationTerms() for term in self.terms])
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
       return new
+    if _unchanged(self, old):
+      return self
     return Predicate(self.name,
       [term.replace(old, new) for term in self.terms]
     )
 
   def occurs(self, unification_term):
-    return any([term.occurs(unification_term) for term in self.terms])
-
-  def __eq__(self, other):
-    if not isinstance(other, Predicate):
-      return False
-    if self.name != other.name:
-      return False
-    if len(self.terms) != len(other.terms):
-      return False
-    return all(
-      [self.terms[i] == other.terms[i] for i in range(len(self.terms))]
-    )
-
-  def setInstantiationTime(self, time):
-    for term in self.terms:
-      term.setInstantiationTime(time)
+    return unification_term in self.free_unification_terms
 
   def __str__(self):
     if len(self.terms) == 0:
@@ -182,236 +243,259 @@ class Predicate:
       [str(term) for term in self.terms]
     ) + ')'
 
-  def __hash__(self):
-    return hash(str(self))
+  def __reduce__(self):
+    return (Predicate, (self.name, self.terms))
 
-class Not:
-  def __init__(self, formula):
-    self.formula = formula
+class Not(Node):
+  __slots__ = ('formula', 'free_variables', 'free_unification_terms',
+    'hash', '__weakref__')
+
+  def __new__(cls, formula):
+    key = (cls, formula)
+    node = _nodes.get(key)
+    if node is None:
+      node = _makeNode(cls, key, hash((5, formula.hash)),
+        formula=formula,
+        free_variables=formula.free_variables,
+        free_unification_terms=formula.free_unification_terms
+      )
+    return node
 
   def freeVariables(self):
-    return self.formula.freeVariables()
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    return self.formula.freeUnificationTerms()
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
       return new
+    if _unchanged(self, old):
+      return self
     return Not(self.formula.replace(old, new))
 
   def occurs(self, unification_term):
-    return self.formula.occurs(unification_term)
-
-  def setInstantiationTime(self, time):
-    self.formula.setInstantiationTime(time)
-
-  def __eq__(self, other):
-    if not isinstance(other, Not):
-      return False
-    return self.formula == other.formula
+    return unification_term in self.free_unification_terms
 
   def __str__(self):
     return '¬' + str(self.formula)
 
-  def __hash__(self):
-    return hash(str(self))
-
-class And:
-  def __init__(self, formula_a, formula_b):
-    self.formula_a = formula_a
-    self.formula_b = formula_b
+  def __reduce__(self):
+    return (Not, (self.formula,))
+
+class And(Node):
+  __slots__ = ('formula_a', 'formula_b', 'free_variables',
+    'free_unification_terms', 'hash', '__weakref__')
+
+  def __new__(cls, formula_a, formula_b):
+    key = (cls, formula_a, formula_b)
+    node = _nodes.get(key)
+    if node is None:
+      node = _makeNode(cls, key, hash((6, formula_a.hash, formula_b.hash)),
+        formula_a=formula_a,
+        formula_b=formula_b,
+        free_variables=_union(
+          [formula_a.free_variables, formula_b.free_variables]),
+        free_unification_terms=_union(
+          [formula_a.free_unification_terms, formula_b.free_unification_terms])
+      )
+    return node
 
   def freeVariables(self):
-    return self.formula_a.freeVariables() | \
-      self.formula_b.freeVariables()
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    return self.formula_a.freeUnificationTerms() | \
-      self.formula_b.freeUnificationTerms()
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
       return new
+    if _unchanged(self, old):
+      return self
     return And(
       self.formula_a.replace(old, new),
       self.formula_b.replace(old, new)
     )
 
   def occurs(self, unification_term):
-    return self.formula_a.occurs(unification_term) or \
-      self.formula_b.occurs(unification_term)
-
-  def setInstantiationTime(self, time):
-    self.formula_a.setInstantiationTime(time)
-    self.formula_b.setInstantiationTime(time)
-
-  def __eq__(self, other):
-    if not isinstance(other, And):
-      return False
-    return self.formula_a == other.formula_a and \
-      self.formula_b == other.formula_b
+    return unification_term in self.free_unification_terms
 
   def __str__(self):
     return '(%s ∧ %s)' % (self.formula_a, self.formula_b)
 
-  def __hash__(self):
-    return hash(str(self))
-
-class Or:
-  def __init__(self, formula_a, formula_b):
-    self.formula_a = formula_a
-    self.formula_b = formula_b
+  def __reduce__(self):
+    return (And, (self.formula_a, self.formula_b))
+
+class Or(Node):
+  __slots__ = ('formula_a', 'formula_b', 'free_variables',
+    'free_unification_terms', 'hash', '__weakref__')
+
+  def __new__(cls, formula_a, formula_b):
+    key = (cls, formula_a, formula_b)
+    node = _nodes.get(key)
+    if node is None:
+      node = _makeNode(cls, key, hash((7, formula_a.hash, formula_b.hash)),
+        formula_a=formula_a,
+        formula_b=formula_b,
+        free_variables=_union(
+          [formula_a.free_variables, formula_b.free_variables]),
+        free_unification_terms=_union(
+          [formula_a.free_unification_terms, formula_b.free_unification_terms])
+      )
+    return node
 
   def freeVariables(self):
-    return self.formula_a.freeVariables() | \
-      self.formula_b.freeVariables()
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    return self.formula_a.freeUnificationTerms() | \
-      self.formula_b.freeUnificationTerms()
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
       return new
+    if _unchanged(self, old):
+      return self
     return Or(
       self.formula_a.replace(old, new),
       self.formula_b.replace(old, new)
     )
 
   def occurs(self, unification_term):
-    return self.formula_a.occurs(unification_term) or \
-      self.formula_b.occurs(unification_term)
-
-  def setInstantiationTime(self, time):
-    self.formula_a.setInstantiationTime(time)
-    self.formula_b.setInstantiationTime(time)
-
-  def __eq__(self, other):
-    if not isinstance(other, Or):
-      return False
-    return self.formula_a == other.formula_a and \
-      self.formula_b == other.formula_b
+    return unification_term in self.free_unification_terms
 
   def __str__(self):
     return '(%s ∨ %s)' % (self.formula_a, self.formula_b)
 
-  def __hash__(self):
-    return hash(str(self))
-
-class Implies:
-  def __init__(self, formula_a, formula_b):
-    self.formula_a = formula_a
-    self.formula_b = formula_b
+  def __reduce__(self):
+    return (Or, (self.formula_a, self.formula_b))
+
+class Implies(Node):
+  __slots__ = ('formula_a', 'formula_b', 'free_variables',
+    'free_unification_terms', 'hash', '__weakref__')
+
+  def __new__(cls, formula_a, formula_b):
+    key = (cls, formula_a, formula_b)
+    node = _nodes.get(key)
+    if node is None:
+      node = _makeNode(cls, key, hash((8, formula_a.hash, formula_b.hash)),
+        formula_a=formula_a,
+        formula_b=formula_b,
+        free_variables=_union(
+          [formula_a.free_variables, formula_b.free_variables]),
+        free_unification_terms=_union(
+          [formula_a.free_unification_terms, formula_b.free_unification_terms])
+      )
+    return node
 
   def freeVariables(self):
-    return self.formula_a.freeVariables() | \
-      self.formula_b.freeVariables()
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    return self.formula_a.freeUnificationTerms() | \
-      self.formula_b.freeUnificationTerms()
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
       return new
+    if _unchanged(self, old):
+      return self
     return Implies(
       self.formula_a.replace(old, new),
       self.formula_b.replace(old, new)
     )
 
   def occurs(self, unification_term):
-    return self.formula_a.occurs(unification_term) or \
-      self.formula_b.occurs(unification_term)
-
-  def setInstantiationTime(self, time):
-    self.formula_a.setInstantiationTime(time)
-    self.formula_b.setInstantiationTime(time)
-
-  def __eq__(self, other):
-    if not isinstance(other, Implies):
-      return False
-    return self.formula_a == other.formula_a and \
-      self.formula_b == other.formula_b
+    return unification_term in self.free_unification_terms
 
   def __str__(self):
     return '(%s → %s)' % (self.formula_a, self.formula_b)
 
-  def __hash__(self):
-    return hash(str(self))
-
-class ForAll:
-  def __init__(self, variable, formula):
-    self.variable = variable
-    self.formula = formula
+  def __reduce__(self):
+    return (Implies, (self.formula_a, self.formula_b))
+
+class ForAll(Node):
+  __slots__ = ('variable', 'formula', 'free_variables',
+    'free_unification_terms', 'hash', '__weakref__')
+
+  def __new__(cls, variable, formula):
+    key = (cls, variable, formula)
+    node = _nodes.get(key)
+    if node is None:
+      free_variables = formula.free_variables
+      if variable in free_variables:
+        free_variables = free_variables - { variable }
+      node = _makeNode(cls, key, hash((9, variable.hash, formula.hash)),
+        variable=variable,
+        formula=formula,
+        free_variables=free_variables,
+        free_unification_terms=formula.free_unification_terms
+      )
+    return node
 
   def freeVariables(self):
-    return self.formula.freeVariables() - { self.variable }
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    return self.formula.freeUnificationTerms()
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
       return new
+    if _unchanged(self, old):
+      return self
     return ForAll(
       self.variable.replace(old, new),
       self.formula.replace(old, new)
     )
 
   def occurs(self, unification_term):
-    return self.formula.occurs(unification_term)
-
-  def setInstantiationTime(self, time):
-    self.variable.setInstantiationTime(time)
-    self.formula.setInstantiationTime(time)
-
-  def __eq__(self, other):
-    if not isinstance(other, ForAll):
-      return False
-    return self.variable == other.variable and \
-      self.formula == other.formula
+    return unification_term in self.free_unification_terms
 
   def __str__(self):
     return '(∀%s. %s)' % (self.variable, self.formula)
 
-  def __hash__(self):
-    return hash(str(self))
-
-class ThereExists:
-  def __init__(self, variable, formula):
-    self.variable = variable
-    self.formula = formula
+  def __reduce__(self):
+    return (ForAll, (self.variable, self.formula))
+
+class ThereExists(Node):
+  __slots__ = ('variable', 'formula', 'free_variables',
+    'free_unification_terms', 'hash', '__weakref__')
+
+  def __new__(cls, variable, formula):
+    key = (cls, variable, formula)
+    node = _nodes.get(key)
+    if node is None:
+      free_variables = formula.free_variables
+      if variable in free_variables:
+        free_variables = free_variables - { variable }
+      node = _makeNode(cls, key, hash((10, variable.hash, formula.hash)),
+        variable=variable,
+        formula=formula,
+        free_variables=free_variables,
+        free_unification_terms=formula.free_unification_terms
+      )
+    return node
 
   def freeVariables(self):
-    return self.formula.freeVariables() - { self.variable }
+    return self.free_variables
 
   def freeUnificationTerms(self):
-    return self.formula.freeUnificationTerms()
+    return self.free_unification_terms
 
   def replace(self, old, new):
     if self == old:
       return new
+    if _unchanged(self, old):
+      return self
     return ThereExists(
       self.variable.replace(old, new),
       self.formula.replace(old, new)
     )
 
   def occurs(self, unification_term):
-    return self.formula.occurs(unification_term)
-
-  def setInstantiationTime(self, time):
-    self.variable.setInstantiationTime(time)
-    self.formula.setInstantiationTime(time)
-
-  def __eq__(self, other):
-    if not isinstance(other, ThereExists):
-      return False
-    return self.variable == other.variable and \
-      self.formula == other.formula
+    return unification_term in self.free_unification_terms
 
   def __str__(self):
     return '(∃%s. %s)' % (self.variable, self.formula)
 
-  def __hash__(self):
-    return hash(str(self))
+  def __reduce__(self):
+    return (ThereExists, (self.variable, self.formula))
@@ -3,7 +3,15 @@
 
 # 2014 Stephan Boyer
 
+import argparse
+import json
+import sys
 from prover import *
+from cache import ProofCache
+from canonical import formulaKey
+from relevance import SineFilter
+from sat import isQuantifierFree
+from preprocess import preprocess
 
 ##############################################################################
 # Command-line interface
@@ -351,7 +359,95 @@ def check_formula(formula):
     else:
       raise InvalidInputError('Enter a formula, not a term.')
 
-def main():
+# the axiom or lemma which is the same as the formula up to the names of
+# bound variables and the order of conjuncts and disjuncts, or None
+def known_formula(formula, axioms, lemmas):
+  key = formulaKey(formula)
+  for known in list(axioms) + list(lemmas):
+    if formulaKey(known) == key:
+      return known
+  return None
+
+# prove a formula from the axioms and lemmas, preprocessing them first (see
+# preprocess.py) if asked to; result.used names the original formulae
+def prove_formula(formula, axioms, lemmas, preprocessing=False, **options):
+  known = axioms | set(lemmas.keys())
+  if not preprocessing:
+    return proveFormula(known, formula, **options)
+  prepared = preprocess(known, formula)
+  result = proveFormula(list(prepared.axioms), prepared.formula, **options)
+  if result.used is not None:
+    result.used = prepared.originalAxioms(result.used)
+  result.stats['preprocess'] = prepared.stats
+  return result
+
+# the axioms and lemmas a lemma depends on: those its proof used, or all of
+# them if that is not known (e.g. the result came from a cache entry stored
+# before proofs recorded it)
+def lemma_dependencies(result, axioms, lemmas):
+  if result.used is None:
+    return axioms | set(lemmas.keys())
+  return set(result.used)
+
+# remove an axiom (with the lemmas that depend on it, directly or through
+# other lemmas) or a lemma (the lemmas that depend on it then depend on what
+# it depended on instead)
+# returns 'axiom', 'lemma' or None (if it is neither) and the lemmas removed
+# along with an axiom
+def remove_formula(formula, axioms, lemmas):
+  known = known_formula(formula, axioms, lemmas)
+  if known is not None:
+    formula = known
+  if formula in axioms:
+    axioms.remove(formula)
+    removed = { formula }
+    bad_lemmas = []
+    while True:
+      new_bad_lemmas = [lemma for lemma, dependencies in lemmas.items()
+        if len(dependencies & removed) > 0]
+      if len(new_bad_lemmas) == 0:
+        break
+      for lemma in new_bad_lemmas:
+        del lemmas[lemma]
+        removed.add(lemma)
+      bad_lemmas += new_bad_lemmas
+    return 'axiom', bad_lemmas
+  if formula in lemmas:
+    dependencies = lemmas.pop(formula)
+    for lemma in lemmas:
+      if formula in lemmas[lemma]:
+        lemmas[lemma] = (lemmas[lemma] - { formula }) | dependencies
+    return 'lemma', []
+  return None, []
+
+# the truth values of the atoms in a counterexample, by name
+def counterexample_values(result):
+  return { str(atom): value
+    for atom, value in result.counterexample.items() }
+
+def print_counterexample(result):
+  if result.counterexample is not None:
+    values = counterexample_values(result)
+    print('Counterexample: %s.' % ', '.join(['%s = %s' %
+      (atom, 'true' if values[atom] else 'false')
+      for atom in sorted(values)]))
+
+# a tracer to print the proof of a formula at the prompt; a problem without
+# quantifiers is decided without a proof search (see sat.py), so its proof
+# is only searched for and shown if asked for
+def repl_tracer(formula, axioms, lemmas, proof):
+  if proof:
+    return TextTracer()
+  for known in [formula] + list(axioms) + list(lemmas):
+    if not isQuantifierFree(known):
+      return TextTracer()
+  return None
+
+def print_untraced(result, proof):
+  if proof and result.stats.get('traced') is False:
+    print('The proof is too long to show.')
+
+def repl(cache=None, relevance=None, preprocessing=False, proof=False):
   print('First-Order Logic Theorem Prover')
   print('2014 Stephan Boyer')
   print('')
@@ -410,23 +506,25 @@ def main():
       elif len(tokens) > 0 and tokens[0] == 'lemma':
         formula = parse(tokens[1:])
         check_formula(formula)
-        result = proveFormula(axioms | set(lemmas.keys()), formula)
+        known = known_formula(formula, axioms, lemmas)
+        if known is not None:
+          print('Already known: %s.' % known)
+          continue
+        result = prove_formula(formula, axioms, lemmas, preprocessing,
+          tracer=repl_tracer(formula, axioms, lemmas, proof), cache=cache,
+          relevance=relevance)
+        print_untraced(result, proof)
         if result:
-          lemmas[formula] = axioms.copy()
+          lemmas[formula] = lemma_dependencies(result, axioms, lemmas)
           print('Lemma proven: %s.' % formula)
         else:
           print('Lemma unprovable: %s.' % formula)
+          print_counterexample(result)
       elif len(tokens) > 0 and tokens[0] == 'remove':
         formula = parse(tokens[1:])
         check_formula(formula)
-        if formula in axioms:
-          axioms.remove(formula)
-          bad_lemmas = []
-          for lemma, dependent_axioms in lemmas.items():
-            if formula in dependent_axioms:
-              bad_lemmas.append(lemma)
-          for lemma in bad_lemmas:
-            del lemmas[lemma]
+        kind, bad_lemmas = remove_formula(formula, axioms, lemmas)
+        if kind == 'axiom':
           print('Axiom removed: %s.' % formula)
           if len(bad_lemmas) == 1:
             print('This lemma was proven using that ' \
@@ -438,8 +536,7 @@ def main():
               'axiom and were also removed:')
             for lemma in bad_lemmas:
               print('  %s' % lemma)
-        elif formula in lemmas:
-          del lemmas[formula]
+        elif kind == 'lemma':
           print('Lemma removed: %s.' % formula)
         else:
           print('Not an axiom: %s.' % formula)
@@ -451,11 +548,19 @@ def main():
       else:
         formula = parse(tokens)
         check_formula(formula)
-        result = proveFormula(axioms | set(lemmas.keys()), formula)
+        known = known_formula(formula, axioms, lemmas)
+        if known is not None:
+          print('Already known: %s.' % known)
+          continue
+        result = prove_formula(formula, axioms, lemmas, preprocessing,
+          tracer=repl_tracer(formula, axioms, lemmas, proof), cache=cache,
+          relevance=relevance)
+        print_untraced(result, proof)
         if result:
           print('Formula proven: %s.' % formula)
         else:
           print('Formula unprovable: %s.' % formula)
+          print_counterexample(result)
     except InvalidInputError as e:
       print(e.message)
     except KeyboardInterrupt:
@@ -464,5 +569,136 @@ def main():
       print('')
       break
 
+# Batch mode reads the same commands as the prompt, one per line (blank
+# lines and lines starting with # are skipped), and writes one JSON object
+# per line of output for each formula or lemma it proves and for each line
+# it cannot parse. A formula which is already an axiom or lemma up to
+# renaming is not proven again; its record names that formula as known.
+# Nothing else is printed, so the output can be consumed as a stream.
+def run_batch(lines, budget=None, proof=False, cache=None,
+  relevance=None, preprocessing=False, output=sys.stdout):
+  axioms = set()
+  lemmas = {}
+
+  def emit(record):
+    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+    output.flush()
+
+  commands = ['axiom', 'lemma', 'remove', 'reset']
+  for number, line in enumerate(lines, 1):
+    line = line.strip()
+    if line == '' or line.startswith('#'):
+      continue
+    try:
+      tokens = [(token.lower() if token in commands else token)
+        for token in lex(line)]
+      for token in tokens[1:]:
+        if token in commands:
+          raise InvalidInputError('Unexpected keyword: %s.' % token)
+      if tokens[0] == 'axiom':
+        formula = parse(tokens[1:])
+        check_formula(formula)
+        axioms.add(formula)
+      elif tokens[0] == 'remove':
+        formula = parse(tokens[1:])
+        check_formula(formula)
+        remove_formula(formula, axioms, lemmas)
+      elif tokens[0] == 'reset':
+        if len(tokens) > 1:
+          raise InvalidInputError('Unexpected: %s.' % tokens[1])
+        axioms = set()
+        lemmas = {}
+      else:
+        command = 'formula'
+        if tokens[0] == 'lemma':
+          command = 'lemma'
+          tokens = tokens[1:]
+        formula = parse(tokens)
+        check_formula(formula)
+        known = known_formula(formula, axioms, lemmas)
+        if known is not None:
+          emit({
+            'line': number,
+            'command': command,
+            'formula': str(formula),
+            'status': PROVEN,
+            'time': 0.0,
+            'steps': 0,
+            'known': str(known)
+          })
+          continue
+        tracer = RecordingTracer() if proof else None
+        result = prove_formula(formula, axioms, lemmas, preprocessing,
+          tracer=tracer, budget=budget, cache=cache, relevance=relevance)
+        if command == 'lemma' and result:
+          lemmas[formula] = lemma_dependencies(result, axioms, lemmas)
+        record = {
+          'line': number,
+          'command': command,
+          'formula': str(formula),
+          'status': result.status,
+          'time': result.stats['seconds'],
+          'steps': result.stats['steps']
+        }
+        if result.reason is not None:
+          record['reason'] = result.reason
+        if result.counterexample is not None:
+          record['counterexample'] = counterexample_values(result)
+        if preprocessing:
+          record['preprocess'] = result.stats['preprocess']
+        if result.stats.get('cached'):
+          record['cached'] = True
+        elif proof:
+          # null if the proof was too long to replay (see proveFormula)
+          if result.stats.get('traced') is False:
+            record['proof'] = None
+          else:
+            record['proof'] = tracer.render()
+        emit(record)
+    except InvalidInputError as e:
+      emit({ 'line': number, 'error': e.message })
+
+def main():
+  parser = argparse.ArgumentParser(
+    description='First-order logic theorem prover.')
+  parser.add_argument('--batch', nargs='?', const='-', metavar='FILE',
+    help='read commands from FILE (or standard input) and write JSON ' \
+      'lines instead of starting the prompt')
+  parser.add_argument('--steps', type=int,
+    help='in batch mode, give up on a formula after this many steps')
+  parser.add_argument('--seconds', type=float,
+    help='in batch mode, give up on a formula after this many seconds')
+  parser.add_argument('--proof', action='store_true',
+    help='in batch mode, include the proof in each result; at the ' \
+      'prompt, also show proofs of formulae without quantifiers')
+  parser.add_argument('--cache', metavar='FILE',
+    help='remember results in (and reuse them from) the database FILE')
+  parser.add_argument('--relevance', action='store_true',
+    help='try each formula with the axioms and lemmas that look relevant ' \
+      'to it before trying all of them')
+  parser.add_argument('--preprocess', action='store_true',
+    help='simplify the axioms, lemmas and formula before proving it')
+  args = parser.parse_args()
+
+  cache = None
+  if args.cache is not None:
+    cache = ProofCache(args.cache)
+  relevance = None
+  if args.relevance:
+    relevance = SineFilter()
+  if args.batch is None:
+    repl(cache, relevance, args.preprocess, args.proof)
+    return
+  budget = None
+  if args.steps is not None or args.seconds is not None:
+    budget = Budget(steps=args.steps, seconds=args.seconds)
+  if args.batch == '-':
+    run_batch(sys.stdin, budget, args.proof, cache, relevance,
+      args.preprocess)
+  else:
+    with open(args.batch) as lines:
+      run_batch(lines, budget, args.proof, cache, relevance,
+        args.preprocess)
+
 if __name__ == '__main__':
   main()
@@ -0,0 +1,215 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+import json
+import multiprocessing
+import queue
+from prover import *
+
+##############################################################################
+# Batch proving
+##############################################################################
+
+# A batch proves many formulae against the same axioms on a pool of worker
+# processes. The axioms and the prover options are sent to each worker once,
+# when it starts, so a task only carries its formula. Results come back in
+# the order the proofs finish, not the order of the formulae.
+
+# the axioms and options of the batch this worker serves
+_worker_axioms = None
+_worker_options = None
+
+def _startWorker(axioms, options):
+  global _worker_axioms, _worker_options
+  _worker_axioms = axioms
+  _worker_options = options
+
+def _proveTask(task):
+  index, formula = task
+  return index, proveFormula(_worker_axioms, formula, **_worker_options)
+
+# yields (index, result) pairs as the proofs finish, where index is the
+# position of the formula in formulas
+# the budget applies to each formula separately; the other options (e.g.
+# scheduler or deepening) are passed to proveFormula
+# processes defaults to the number of cores
+def proveBatch(axioms, formulas, processes=None, budget=None, **options):
+  options['budget'] = budget
+  pool = multiprocessing.Pool(processes, _startWorker,
+    (list(axioms), options))
+  try:
+    for index, result in pool.imap_unordered(_proveTask,
+      enumerate(formulas)):
+      yield index, result
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+##############################################################################
+# Branch farming
+##############################################################################
+
+# When a sequent without siblings splits in two, the branches share no
+# unification terms, so each is a separate subproof. A farm hands one branch
+# of such a split to an idle worker, which proves it from scratch, while the
+# prover carries on with the other. The proof fails as soon as a farmed
+# branch does. Farmed branches are not reported to the tracer.
+
+def _proveBranch(left, right, origins, depth, options):
+  return proveSequent(Sequent(dict(left), dict(right), None, depth,
+    origins=(dict(origins[0]), dict(origins[1]))), **options)
+
+class BranchFarm:
+  def __init__(self, pool, processes, options):
+    self.pool = pool
+    self.processes = processes
+    self.options = options
+
+    # results are put here by the pool's callback thread
+    self.results = queue.Queue()
+    self.pending = 0
+    self.failed = None
+    self.steps = 0
+
+    # the origins used by the branches proven so far
+    self.used = frozenset()
+
+  # take a branch if it is independent and a worker is free
+  def submit(self, sequent):
+    self.collect(False)
+    if sequent.siblings is not None or self.pending >= self.processes:
+      return False
+    origins = (list(sequent.left_origins.items()),
+      list(sequent.right_origins.items()))
+    self.pool.apply_async(_proveBranch, (list(sequent.left.items()),
+      list(sequent.right.items()), origins, sequent.depth, self.options),
+      callback=self.results.put, error_callback=self.results.put)
+    self.pending += 1
+    return True
+
+  # take in the finished results (waiting for one if block is set)
+  def collect(self, block):
+    while self.pending > 0:
+      try:
+        result = self.results.get(block)
+      except queue.Empty:
+        return
+      block = False
+      self.pending -= 1
+      if isinstance(result, BaseException):
+        raise result
+      self.steps += result.stats['steps']
+      if result:
+        self.used |= result.used
+      elif self.failed is None:
+        self.failed = result
+
+  # the result of a farmed branch that was not proven, if any
+  def failure(self):
+    self.collect(False)
+    return self.failed
+
+  # wait until every branch is proven or one fails
+  def wait(self):
+    while self.pending > 0 and self.failed is None:
+      self.collect(True)
+    return self.failed
+
+# like proveFormula, but independent branches are proven on a pool of
+# worker processes (processes defaults to the number of cores)
+def proveParallel(axioms, formula, processes=None, **options):
+  if processes is None:
+    processes = multiprocessing.cpu_count()
+  branch_options = { key: options[key] for key in
+    ('scheduler', 'budget', 'deepening', 'dedup') if key in options }
+  pool = multiprocessing.Pool(processes)
+  try:
+    farm = BranchFarm(pool, processes, branch_options)
+    result = proveFormula(axioms, formula, farm=farm, **options)
+    result.stats['steps'] += farm.steps
+    return result
+  finally:
+    pool.terminate()
+    pool.join()
+
+##############################################################################
+# Strategy portfolios
+##############################################################################
+
+# A portfolio runs the same problem under several strategies at once, each
+# in its own process, and takes the first definitive answer (proven or
+# unprovable); the other strategies are then killed. A strategy is a name
+# and the keyword arguments it passes to proveFormula. Wins can be appended
+# to a JSON lines history file, and with fewer processes than strategies the
+# strategies that won most often in the history are started first.
+
+STRATEGIES = {
+  'fifo': { },
+  'smallest': { 'scheduler': 'smallest' },
+  'oldest-group': { 'scheduler': 'oldest-group' },
+  'deepening': { 'deepening': 1 },
+}
+
+def _proveStrategy(name, axioms, formula, options):
+  return name, proveFormula(axioms, formula, **options)
+
+# the number of wins of each strategy in a history file
+def strategyWins(history):
+  wins = { }
+  try:
+    with open(history) as lines:
+      for line in lines:
+        if line.strip() != '':
+          name = json.loads(line)['strategy']
+          wins[name] = wins.get(name, 0) + 1
+  except IOError:
+    pass
+  return wins
+
+# returns (name, result) for the strategy that answered first; if every
+# strategy ran out of budget, the name is None and the result is unknown
+def provePortfolio(axioms, formula, strategies=None, budget=None,
+  processes=None, history=None):
+  if strategies is None:
+    strategies = STRATEGIES
+  names = list(strategies)
+  if history is not None:
+    wins = strategyWins(history)
+    names.sort(key=lambda name: -wins.get(name, 0))
+  if processes is None:
+    processes = len(names)
+  results = queue.Queue()
+  pool = multiprocessing.Pool(processes)
+  try:
+    for name in names:
+      options = dict(strategies[name])
+      if budget is not None:
+        options['budget'] = budget
+      pool.apply_async(_proveStrategy, (name, list(axioms), formula,
+        options), callback=results.put, error_callback=results.put)
+    winner = None
+    for i in range(len(names)):
+      answer = results.get()
+      if isinstance(answer, BaseException):
+        raise answer
+      name, result = answer
+      if result.status != UNKNOWN:
+        winner = name
+        break
+  finally:
+    pool.terminate()
+    pool.join()
+
+  if winner is not None and history is not None:
+    with open(history, 'a') as lines:
+      lines.write(json.dumps({
+        'formula': str(formula),
+        'strategy': winner,
+        'status': result.status,
+        'seconds': result.stats['seconds'],
+        'steps': result.stats['steps']
+      }, ensure_ascii=False) + '\n')
+  return winner, result
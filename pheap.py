@@ -0,0 +1,74 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+##############################################################################
+# Persistent heaps
+##############################################################################
+
+# A persistent heap is a leftist heap: a binary tree ordered so that every
+# node is no greater than its children, where the right spine of each
+# subtree is never longer than the left one. Two heaps are merged along
+# their right spines in O(log n), and pushing or popping is a merge that
+# copies only the nodes on that path, so the original heap is left
+# unchanged and shares the rest of its nodes with the result.
+
+class HeapNode:
+  __slots__ = ('rank', 'item', 'left', 'right')
+
+  def __init__(self, item, left, right):
+    # the rank is the length of the right spine
+    if rank(left) < rank(right):
+      left, right = right, left
+    self.rank = rank(right) + 1
+    self.item = item
+    self.left = left
+    self.right = right
+
+def rank(node):
+  return 0 if node is None else node.rank
+
+def merge(node_a, node_b):
+  if node_a is None:
+    return node_b
+  if node_b is None:
+    return node_a
+  if node_b.item < node_a.item:
+    node_a, node_b = node_b, node_a
+  return HeapNode(node_a.item, node_a.left, merge(node_a.right, node_b))
+
+class PersistentHeap:
+  __slots__ = ('root', 'size')
+
+  def __init__(self, items=()):
+    self.root = None
+    self.size = 0
+    for item in items:
+      self.root = merge(self.root, HeapNode(item, None, None))
+      self.size += 1
+
+  def __len__(self):
+    return self.size
+
+  # the smallest item, or None if the heap is empty
+  def peek(self):
+    if self.root is None:
+      return None
+    return self.root.item
+
+  # a heap with the item added
+  def push(self, item):
+    result = PersistentHeap()
+    result.root = merge(self.root, HeapNode(item, None, None))
+    result.size = self.size + 1
+    return result
+
+  # a heap without its smallest item
+  def pop(self):
+    if self.root is None:
+      raise IndexError('pop from an empty heap')
+    result = PersistentHeap()
+    result.root = merge(self.root.left, self.root.right)
+    result.size = self.size - 1
+    return result
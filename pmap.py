@@ -0,0 +1,213 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+##############################################################################
+# Persistent maps
+##############################################################################
+
+# A persistent map is a hash array mapped trie: a 32-way tree indexed by
+# successive 5-bit slices of the key hash, where each node stores only its
+# present children next to a bitmap of which slots are used. Updates copy
+# the path from the root to the changed leaf and share everything else, so
+# a modified map costs O(log n) time and memory and the original is left
+# unchanged. Entries are (key, value) tuples; subtrees are node objects.
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+class BitmapNode:
+  __slots__ = ('bitmap', 'entries')
+
+  def __init__(self, bitmap, entries):
+    self.bitmap = bitmap
+    self.entries = entries
+
+# keys whose hashes agree in every bit share a collision node
+class CollisionNode:
+  __slots__ = ('entries',)
+
+  def __init__(self, entries):
+    self.entries = entries
+
+EMPTY_NODE = BitmapNode(0, ())
+
+def keyHash(key):
+  return hash(key) & HASH_MASK
+
+def lookup(node, key, key_hash, default):
+  shift = 0
+  while True:
+    if isinstance(node, CollisionNode):
+      for entry in node.entries:
+        if entry[0] == key:
+          return entry[1]
+      return default
+    bit = 1 << ((key_hash >> shift) & MASK)
+    if not node.bitmap & bit:
+      return default
+    entry = node.entries[(node.bitmap & (bit - 1)).bit_count()]
+    if isinstance(entry, tuple):
+      if entry[0] == key:
+        return entry[1]
+      return default
+    node = entry
+    shift += BITS
+
+# a node holding two entries whose hashes agree below the given shift
+def pairNode(entry_a, hash_a, entry_b, hash_b, shift):
+  if shift >= HASH_BITS:
+    return CollisionNode((entry_a, entry_b))
+  bit_a = 1 << ((hash_a >> shift) & MASK)
+  bit_b = 1 << ((hash_b >> shift) & MASK)
+  if bit_a == bit_b:
+    return BitmapNode(bit_a,
+      (pairNode(entry_a, hash_a, entry_b, hash_b, shift + BITS),))
+  if bit_a < bit_b:
+    return BitmapNode(bit_a | bit_b, (entry_a, entry_b))
+  return BitmapNode(bit_a | bit_b, (entry_b, entry_a))
+
+# returns the new node and whether a key was added
+def insert(node, key, key_hash, value, shift):
+  if isinstance(node, CollisionNode):
+    entries = node.entries
+    for i in range(len(entries)):
+      if entries[i][0] == key:
+        if entries[i][1] is value:
+          return node, False
+        return CollisionNode(
+          entries[:i] + ((key, value),) + entries[i + 1:]), False
+    return CollisionNode(entries + ((key, value),)), True
+  bit = 1 << ((key_hash >> shift) & MASK)
+  index = (node.bitmap & (bit - 1)).bit_count()
+  entries = node.entries
+  if not node.bitmap & bit:
+    return BitmapNode(node.bitmap | bit,
+      entries[:index] + ((key, value),) + entries[index:]), True
+  entry = entries[index]
+  if isinstance(entry, tuple):
+    if entry[0] == key:
+      if entry[1] is value:
+        return node, False
+      replacement = (key, value)
+      added = False
+    else:
+      replacement = pairNode(entry, keyHash(entry[0]), (key, value),
+        key_hash, shift + BITS)
+      added = True
+  else:
+    replacement, added = insert(entry, key, key_hash, value, shift + BITS)
+    if replacement is entry:
+      return node, False
+  return BitmapNode(node.bitmap,
+    entries[:index] + (replacement,) + entries[index + 1:]), added
+
+# returns the new node (None if it became empty) and whether a key was
+# removed
+def remove(node, key, key_hash, shift):
+  if isinstance(node, CollisionNode):
+    entries = tuple([entry for entry in node.entries if entry[0] != key])
+    if len(entries) == len(node.entries):
+      return node, False
+    return CollisionNode(entries), True
+  bit = 1 << ((key_hash >> shift) & MASK)
+  if not node.bitmap & bit:
+    return node, False
+  index = (node.bitmap & (bit - 1)).bit_count()
+  entries = node.entries
+  entry = entries[index]
+  if isinstance(entry, tuple):
+    if entry[0] != key:
+      return node, False
+    replacement = None
+  else:
+    replacement, removed = remove(entry, key, key_hash, shift + BITS)
+    if not removed:
+      return node, False
+
+    # pull a lone entry up into this node
+    if len(replacement.entries) == 1 and \
+      isinstance(replacement.entries[0], tuple):
+      replacement = replacement.entries[0]
+  if replacement is None:
+    if node.bitmap == bit:
+      return None, True
+    return BitmapNode(node.bitmap & ~bit,
+      entries[:index] + entries[index + 1:]), True
+  return BitmapNode(node.bitmap,
+    entries[:index] + (replacement,) + entries[index + 1:]), True
+
+def entries(node):
+  for entry in node.entries:
+    if isinstance(entry, tuple):
+      yield entry
+    else:
+      yield from entries(entry)
+
+class PersistentMap:
+  __slots__ = ('root', 'size')
+
+  def __init__(self, items=()):
+    self.root = EMPTY_NODE
+    self.size = 0
+    for key, value in items:
+      self.root, added = insert(self.root, key, keyHash(key), value, 0)
+      if added:
+        self.size += 1
+
+  def __len__(self):
+    return self.size
+
+  def __contains__(self, key):
+    return lookup(self.root, key, keyHash(key), self) is not self
+
+  def __getitem__(self, key):
+    value = lookup(self.root, key, keyHash(key), self)
+    if value is self:
+      raise KeyError(key)
+    return value
+
+  def get(self, key, default=None):
+    return lookup(self.root, key, keyHash(key), default)
+
+  def __iter__(self):
+    for entry in entries(self.root):
+      yield entry[0]
+
+  def keys(self):
+    return iter(self)
+
+  def values(self):
+    for entry in entries(self.root):
+      yield entry[1]
+
+  def items(self):
+    return entries(self.root)
+
+  # a map with the key set to the value
+  def set(self, key, value):
+    root, added = insert(self.root, key, keyHash(key), value, 0)
+    if root is self.root:
+      return self
+    result = PersistentMap()
+    result.root = root
+    result.size = self.size + (1 if added else 0)
+    return result
+
+  # a map without the key
+  def delete(self, key):
+    root, removed = remove(self.root, key, keyHash(key), 0)
+    if not removed:
+      raise KeyError(key)
+    result = PersistentMap()
+    result.root = root if root is not None else EMPTY_NODE
+    result.size = self.size - 1
+    return result
+
+  def __str__(self):
+    return '{%s}' % ', '.join(['%s: %s' % (key, value)
+      for key, value in self.items()])
@@ -0,0 +1,276 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+import time
+from language import *
+
+##############################################################################
+# Preprocessing
+##############################################################################
+
+# Preprocessing rewrites the axioms and the goal into equivalent formulae
+# that take the prover fewer steps. Each pass replaces a formula by one that
+# is equivalent to it (assuming, as the prover does, that the domain is not
+# empty), so a problem is provable exactly when its preprocessed form is:
+#
+#   nnf        eliminates implications and pushes negations down to the
+#              atoms, turning quantifiers over
+#   simplify   removes repeated conjuncts and disjuncts, and conjunctions and
+#              disjunctions made trivially true or false by an operand and its
+#              negation; axioms that become trivially true are dropped
+#   miniscope  moves quantifiers down over the conjunctions and disjunctions
+#              they distribute over, and past the operands that do not use
+#              their variable, so each instantiation copies less
+#   vacuous    drops quantifiers whose variable does not occur
+#
+# There are no formulae for true and false, so a goal that simplifies to
+# one of them, or an axiom that simplifies to false, is kept as it was
+# before that pass.
+
+PASSES = ('nnf', 'simplify', 'miniscope', 'vacuous')
+
+# the number of nodes in a formula
+def formulaSize(node):
+  if isinstance(node, Function) or isinstance(node, Predicate):
+    return 1 + sum([formulaSize(term) for term in node.terms])
+  if isinstance(node, Not):
+    return 1 + formulaSize(node.formula)
+  if isinstance(node, ForAll) or isinstance(node, ThereExists):
+    return 1 + formulaSize(node.formula)
+  if isinstance(node, And) or isinstance(node, Or) or \
+    isinstance(node, Implies):
+    return 1 + formulaSize(node.formula_a) + formulaSize(node.formula_b)
+  return 1
+
+# what a pass did: the number of rewrites it made, the formulae it dropped,
+# the time it took and the total size of the formulae after it
+class PassStats:
+  def __init__(self):
+    self.rewrites = 0
+    self.dropped = 0
+    self.seconds = 0.0
+    self.size = 0
+
+  def asDict(self):
+    return {
+      'rewrites': self.rewrites,
+      'dropped': self.dropped,
+      'seconds': self.seconds,
+      'size': self.size
+    }
+
+##############################################################################
+# Negation normal form
+##############################################################################
+
+# the formula, negated if negated is set, with negations only on atoms
+def nnf(formula, stats, negated=False):
+  if isinstance(formula, Predicate):
+    return Not(formula) if negated else formula
+  if isinstance(formula, Not):
+    if not isinstance(formula.formula, Predicate):
+      stats.rewrites += 1
+    return nnf(formula.formula, stats, not negated)
+  if isinstance(formula, And) or isinstance(formula, Or):
+    formula_a = nnf(formula.formula_a, stats, negated)
+    formula_b = nnf(formula.formula_b, stats, negated)
+    if negated:
+      stats.rewrites += 1
+      return (Or if isinstance(formula, And) else And)(formula_a, formula_b)
+    return type(formula)(formula_a, formula_b)
+  if isinstance(formula, Implies):
+    stats.rewrites += 1
+    formula_a = nnf(formula.formula_a, stats, not negated)
+    formula_b = nnf(formula.formula_b, stats, negated)
+    if negated:
+      return And(formula_a, formula_b)
+    return Or(formula_a, formula_b)
+  body = nnf(formula.formula, stats, negated)
+  if negated:
+    stats.rewrites += 1
+    if isinstance(formula, ForAll):
+      return ThereExists(formula.variable, body)
+    return ForAll(formula.variable, body)
+  return type(formula)(formula.variable, body)
+
+##############################################################################
+# Simplification
+##############################################################################
+
+# a formula that simplified to true or false
+TRUE = 'true'
+FALSE = 'false'
+
+def operands(formula, kind, result):
+  if isinstance(formula, kind):
+    operands(formula.formula_a, kind, result)
+    operands(formula.formula_b, kind, result)
+  else:
+    result.append(formula)
+  return result
+
+# the simplified formula, or TRUE or FALSE
+def simplify(formula, stats):
+  if isinstance(formula, Predicate):
+    return formula
+  if isinstance(formula, Not):
+    inner = simplify(formula.formula, stats)
+    if inner is TRUE or inner is FALSE:
+      return FALSE if inner is TRUE else TRUE
+    return Not(inner)
+  if isinstance(formula, And) or isinstance(formula, Or):
+    kind = type(formula)
+    unit, zero = (TRUE, FALSE) if kind is And else (FALSE, TRUE)
+    kept = []
+    for operand in operands(formula, kind, []):
+      operand = simplify(operand, stats)
+      if operand is zero:
+        stats.rewrites += 1
+        return zero
+      if operand is unit or operand in kept:
+        stats.rewrites += 1
+        continue
+      kept.append(operand)
+    for operand in kept:
+      if Not(operand) in kept:
+        stats.rewrites += 1
+        return zero
+    if len(kept) == 0:
+      return unit
+    result = kept[-1]
+    for operand in reversed(kept[:-1]):
+      result = kind(operand, result)
+    return result
+  if isinstance(formula, Implies):
+    formula_a = simplify(formula.formula_a, stats)
+    formula_b = simplify(formula.formula_b, stats)
+    if formula_a is FALSE or formula_b is TRUE or formula_a == formula_b:
+      stats.rewrites += 1
+      return TRUE
+    if formula_a is TRUE:
+      stats.rewrites += 1
+      return formula_b
+    if formula_b is FALSE:
+      stats.rewrites += 1
+      return Not(formula_a)
+    return Implies(formula_a, formula_b)
+  body = simplify(formula.formula, stats)
+  if body is TRUE or body is FALSE:
+    stats.rewrites += 1
+    return body
+  return type(formula)(formula.variable, body)
+
+##############################################################################
+# Miniscoping
+##############################################################################
+
+def miniscope(formula, stats):
+  if isinstance(formula, Predicate):
+    return formula
+  if isinstance(formula, Not):
+    return Not(miniscope(formula.formula, stats))
+  if isinstance(formula, And) or isinstance(formula, Or) or \
+    isinstance(formula, Implies):
+    return type(formula)(miniscope(formula.formula_a, stats),
+      miniscope(formula.formula_b, stats))
+  return quantify(type(formula), formula.variable,
+    miniscope(formula.formula, stats), stats)
+
+# the quantifier kind (ForAll or ThereExists) over the variable and body,
+# moved as far down as it goes: a universal distributes over conjunctions
+# and an existential over disjunctions, and either one skips the operand of
+# a conjunction or disjunction that does not use its variable
+def quantify(kind, variable, body, stats):
+  if variable not in body.freeVariables():
+    return kind(variable, body)
+  distributes = And if kind is ForAll else Or
+  if isinstance(body, distributes):
+    stats.rewrites += 1
+    formula_a, formula_b = body.formula_a, body.formula_b
+    if variable in formula_a.freeVariables():
+      formula_a = quantify(kind, variable, formula_a, stats)
+    if variable in formula_b.freeVariables():
+      formula_b = quantify(kind, variable, formula_b, stats)
+    return distributes(formula_a, formula_b)
+  if isinstance(body, And) or isinstance(body, Or):
+    if variable not in body.formula_a.freeVariables():
+      stats.rewrites += 1
+      return type(body)(body.formula_a,
+        quantify(kind, variable, body.formula_b, stats))
+    if variable not in body.formula_b.freeVariables():
+      stats.rewrites += 1
+      return type(body)(quantify(kind, variable, body.formula_a, stats),
+        body.formula_b)
+  return kind(variable, body)
+
+##############################################################################
+# Vacuous quantifiers
+##############################################################################
+
+def vacuous(formula, stats):
+  if isinstance(formula, Predicate):
+    return formula
+  if isinstance(formula, Not):
+    return Not(vacuous(formula.formula, stats))
+  if isinstance(formula, And) or isinstance(formula, Or) or \
+    isinstance(formula, Implies):
+    return type(formula)(vacuous(formula.formula_a, stats),
+      vacuous(formula.formula_b, stats))
+  body = vacuous(formula.formula, stats)
+  if formula.variable not in body.freeVariables():
+    stats.rewrites += 1
+    return body
+  return type(formula)(formula.variable, body)
+
+##############################################################################
+# Pipeline
+##############################################################################
+
+PASS_FUNCTIONS = {
+  'nnf': nnf,
+  'simplify': simplify,
+  'miniscope': miniscope,
+  'vacuous': vacuous
+}
+
+# The result of preprocessing a problem: axioms maps each preprocessed
+# axiom to the axiom it came from, formula is the preprocessed goal and
+# stats maps the name of each pass to what it did (see PassStats).
+class Preprocessed:
+  def __init__(self, axioms, formula, stats):
+    self.axioms = axioms
+    self.formula = formula
+    self.stats = stats
+
+  # the original axioms among the given preprocessed ones
+  def originalAxioms(self, axioms):
+    return frozenset([self.axioms[axiom] for axiom in axioms])
+
+def preprocess(axioms, formula, passes=PASSES):
+  axioms = { axiom: axiom for axiom in axioms }
+  stats = { }
+  for name in passes:
+    function = PASS_FUNCTIONS[name]
+    pass_stats = PassStats()
+    start = time.monotonic()
+    new_axioms = { }
+    for axiom, original in axioms.items():
+      new_axiom = function(axiom, pass_stats)
+      if new_axiom is TRUE:
+        pass_stats.dropped += 1
+        continue
+      if new_axiom is FALSE:
+        new_axiom = axiom
+      new_axioms.setdefault(new_axiom, original)
+    new_formula = function(formula, pass_stats)
+    if new_formula is TRUE or new_formula is FALSE:
+      new_formula = formula
+    axioms = new_axioms
+    formula = new_formula
+    pass_stats.seconds = time.monotonic() - start
+    pass_stats.size = formulaSize(formula) + \
+      sum([formulaSize(axiom) for axiom in axioms])
+    stats[name] = pass_stats.asDict()
+  return Preprocessed(axioms, formula, stats)
@@ -4,73 +4,494 @@
 # 2014 Stephan Boyer
 
 from language import *
+from index import *
+from scheduler import *
+from tracer import *
+from budget import *
+from canonical import Canonicalizer
+from sat import isQuantifierFree, provePropositional
+from pmap import PersistentMap
+from pheap import PersistentHeap
+import itertools
 
 ##############################################################################
 # Unification
 ##############################################################################
 
+# A unifier holds a triangular substitution: each bound unification term
+# maps to a term that may itself mention bound unification terms, so a
+# binding is never copied into other bindings. Bindings are pushed on a
+# trail, and undo pops them back to an earlier mark.
+class Unifier:
+  def __init__(self):
+    self.bindings = { }
+    self.trail = [ ]
+
+  def mark(self):
+    return len(self.trail)
+
+  def undo(self, mark):
+    while len(self.trail) > mark:
+      del self.bindings[self.trail.pop()]
+
+  def bind(self, unification_term, term):
+    self.bindings[unification_term] = term
+    self.trail.append(unification_term)
+
+  # follow bindings until reaching an unbound unification term or a term
+  # that is not a unification term
+  def resolve(self, term):
+    while isinstance(term, UnificationTerm):
+      bound = self.bindings.get(term)
+      if bound is None:
+        return term
+      term = bound
+    return term
+
+  # check that a unification term can be bound to a term: the term must not
+  # contain it (occurs check) and must not contain anything instantiated
+  # after it (time check), both under the current bindings
+  def admissible(self, unification_term, term):
+    if term.isGround():
+      return term.time <= unification_term.time
+    if isinstance(term, UnificationTerm):
+      if term is unification_term:
+        return False
+      bound = self.bindings.get(term)
+      if bound is None:
+        return term.time <= unification_term.time
+      return self.admissible(unification_term, bound)
+    if not any([subterm in self.bindings
+      for subterm in term.free_unification_terms]):
+      return unification_term not in term.free_unification_terms and \
+        term.time <= unification_term.time
+    return all([self.admissible(unification_term, subterm)
+      for subterm in term.terms])
+
+  def unifyTerms(self, term_a, term_b):
+    term_a = self.resolve(term_a)
+    term_b = self.resolve(term_b)
+    if term_a is term_b:
+      return True
+    if isinstance(term_a, UnificationTerm) and \
+      isinstance(term_b, UnificationTerm):
+      # bind the later term to the earlier one so the time check holds
+      if term_b.time > term_a.time:
+        term_a, term_b = term_b, term_a
+    if isinstance(term_a, UnificationTerm):
+      if not self.admissible(term_a, term_b):
+        return False
+      self.bind(term_a, term_b)
+      return True
+    if isinstance(term_b, UnificationTerm):
+      if not self.admissible(term_b, term_a):
+        return False
+      self.bind(term_b, term_a)
+      return True
+    if term_a.isGround() and term_b.isGround():
+      return False
+    if (isinstance(term_a, Function) and isinstance(term_b, Function)) or \
+       (isinstance(term_a, Predicate) and isinstance(term_b, Predicate)):
+      if term_a.name != term_b.name:
+        return False
+      terms_a = term_a.terms
+      terms_b = term_b.terms
+      if len(terms_a) != len(terms_b):
+        return False
+      for i in range(len(terms_a)):
+        if not self.unifyTerms(terms_a[i], terms_b[i]):
+          return False
+      return True
+    return False
+
+  # solve an equation, leaving the bindings unchanged if it has no solution
+  def unify(self, term_a, term_b):
+    mark = self.mark()
+    if self.unifyTerms(term_a, term_b):
+      return True
+    self.undo(mark)
+    return False
+
+  # apply the bindings to a term
+  def apply(self, term):
+    term = self.resolve(term)
+    if isinstance(term, Function) and not term.isGround():
+      return Function(term.name, [self.apply(subterm)
+        for subterm in term.terms])
+    return term
+
+  # the bindings as a substitution with fully applied values
+  def substitution(self):
+    return { unification_term: self.apply(unification_term)
+      for unification_term in self.trail }
+
 # solve a single equation
 def unify(term_a, term_b):
-  if isinstance(term_a, UnificationTerm):
-    if term_b.occurs(term_a) or term_b.time > term_a.time:
-      return None
-    return { term_a: term_b }
-  if isinstance(term_b, UnificationTerm):
-    if term_a.occurs(term_b) or term_a.time > term_b.time:
-      return None
-    return { term_b: term_a }
-  if isinstance(term_a, Variable) and isinstance(term_b, Variable):
-    if term_a == term_b:
-      return { }
+  unifier = Unifier()
+  if not unifier.unify(term_a, term_b):
     return None
-  if (isinstance(term_a, Function) and isinstance(term_b, Function)) or \
-     (isinstance(term_a, Predicate) and isinstance(term_b, Predicate)):
-    if term_a.name != term_b.name:
-      return None
-    if len(term_a.terms) != len(term_b.terms):
-      return None
-    substitution = { }
-    for i in range(len(term_a.terms)):
-      a = term_a.terms[i]
-      b = term_b.terms[i]
-      for k, v in substitution.items():
-        a = a.replace(k, v)
-        b = b.replace(k, v)
-      sub = unify(a, b)
-      if sub == None:
-        return None
-      for k, v in sub.items():
-        substitution[k] = v
-    return substitution
-  return None
+  return unifier.substitution()
 
 # solve a list of equations
 def unify_list(pairs):
-  substitution = { }
+  unifier = Unifier()
   for term_a, term_b in pairs:
-    a = term_a
-    b = term_b
-    for k, v in substitution.items():
-      a = a.replace(k, v)
-      b = b.replace(k, v)
-    sub = unify(a, b)
-    if sub == None:
+    if not unifier.unify(term_a, term_b):
+      return None
+  return unifier.substitution()
+
+# choose one equation from each list so that all the choices have a common
+# solution, returning the unifier holding that solution and the chosen
+# equations (in the order of the lists), or None
+# the search extends a partial solution one list at a time and backtracks
+# as soon as a choice conflicts with it; trying the lists with the fewest
+# choices first keeps the search tree narrow
+# with a meter (see budget.py), every equation tried counts as a unification
+# attempt, and the search gives up (as if there were no choice) once the
+# meter's budget is exhausted
+def unify_choices(pair_lists, fewest_first=True, meter=None):
+  order = list(range(len(pair_lists)))
+  if fewest_first:
+    order.sort(key=lambda i: len(pair_lists[i]))
+  unifier = Unifier()
+
+  # the choices made so far, as (position, pair index, trail mark) entries
+  # where the mark is taken before the pair was unified
+  stack = []
+  position = 0
+  index = 0
+  while position < len(order):
+    pairs = pair_lists[order[position]]
+    while index < len(pairs):
+      if meter is not None and meter.attempt() is not None:
+        return None
+      mark = unifier.mark()
+      if unifier.unify(pairs[index][0], pairs[index][1]):
+        break
+      index += 1
+    if index < len(pairs):
+      stack.append((position, index, mark))
+      position += 1
+      index = 0
+      continue
+
+    # no pair fits here, so try the next pair for the previous list
+    if len(stack) == 0:
       return None
-    for k, v in sub.items():
-      substitution[k] = v
-  return substitution
+    position, index, mark = stack.pop()
+    unifier.undo(mark)
+    index += 1
+
+  choices = [None] * len(pair_lists)
+  for position, index, mark in stack:
+    choices[order[position]] = pair_lists[order[position]][index]
+  return unifier, choices
+
+##############################################################################
+# Fresh symbols
+##############################################################################
+
+# Fresh variables (v1, v2, ...) and unification terms (t1, t2, ...) come
+# from counters shared by the whole proof, skipping any name that already
+# appears in the problem. Every instantiation gets a new name, so branches
+# never reuse each other's names and nothing has to be scanned.
+class SymbolAllocator:
+  def __init__(self, formulas=()):
+    self.reserved = set()
+    self.counters = { }
+
+    # the names made up so far
+    self.generated = set()
+
+    for formula in formulas:
+      self.reserve(formula)
+
+  def reserve(self, node):
+    if isinstance(node, Variable) or isinstance(node, UnificationTerm):
+      self.reserved.add(node.name)
+    elif isinstance(node, Function) or isinstance(node, Predicate):
+      self.reserved.add(node.name)
+      for term in node.terms:
+        self.reserve(term)
+    elif isinstance(node, Not):
+      self.reserve(node.formula)
+    elif isinstance(node, ForAll) or isinstance(node, ThereExists):
+      self.reserve(node.variable)
+      self.reserve(node.formula)
+    else:
+      self.reserve(node.formula_a)
+      self.reserve(node.formula_b)
+
+  def fresh(self, prefix):
+    counter = self.counters.get(prefix, 0)
+    while True:
+      counter += 1
+      name = prefix + str(counter)
+      if name not in self.reserved:
+        self.counters[prefix] = counter
+        self.generated.add(name)
+        return name
+
+  def variable(self, time):
+    return Variable(self.fresh('v'), time)
+
+  def unificationTerm(self, time):
+    return UnificationTerm(self.fresh('t'), time)
 
 ##############################################################################
 # Sequents
 ##############################################################################
 
+# a sequent hash is the sum of one mix of each formula hash per side, so it
+# does not depend on order and is updated as formulae come and go
+HASH_MASK = (1 << 64) - 1
+LEFT_MULTIPLIER = 0x9E3779B97F4A7C15
+RIGHT_MULTIPLIER = 0xC2B2AE3D27D4EB4F
+
+def leftHash(formula):
+  return ((hash(formula) & HASH_MASK) * LEFT_MULTIPLIER) & HASH_MASK
+
+def rightHash(formula):
+  return ((hash(formula) & HASH_MASK) * RIGHT_MULTIPLIER) & HASH_MASK
+
+# the left and right sides of a sequent are persistent maps from formulae
+# to depths, so a child shares them with its parent and each rule only
+# copies the paths to the formulae it changes
+#
+# Each formula also has its origins: the formulae on the left of the first
+# sequent that it was derived from. A formula on the left of the first
+# sequent is its own origin, and the rules pass the origins of the formula
+# they expand on to the formulae they add (the right of the first sequent
+# has none). The origins of the formulae that close a branch are the ones
+# that branch used. A sequent rebuilt from the middle of a proof can be
+# given the origins of its formulae as a pair of dicts, one per side.
 class Sequent:
-  def __init__(self, left, right, siblings, depth):
+  def __init__(self, left, right, siblings, depth, parent=None,
+    origins=None):
+    if not isinstance(left, PersistentMap):
+      left = PersistentMap(left.items())
+    if not isinstance(right, PersistentMap):
+      right = PersistentMap(right.items())
     self.left = left
     self.right = right
     self.siblings = siblings
     self.depth = depth
 
+    # every sequent is put in the frontier when it is created; this is
+    # cleared when it is taken out or its sibling group is closed
+    self.waiting = True
+
+    # The unifiable pairs of a sequent are cached as a chain of
+    # (pair, rest) cells shared with its parent, so a child only has to
+    # find the pairs involving the atoms that were added to it. The atoms
+    # are looked up in a persistent discrimination tree per side, which a
+    # child also shares with its parent and extends with its own atoms, so
+    # a lookup only sees the atoms of this sequent.
+    if parent is None:
+      self.hash = 0
+      for formula in left:
+        self.hash += leftHash(formula)
+      for formula in right:
+        self.hash += rightHash(formula)
+      self.hash &= HASH_MASK
+      self.unification_terms = PersistentMap()
+      for formula in left:
+        self.countUnificationTerms(formula, 1)
+      for formula in right:
+        self.countUnificationTerms(formula, 1)
+      self.left_index = DiscriminationTree()
+      self.right_index = DiscriminationTree()
+      self.pairs = None
+      self.counter = itertools.count()
+      self.left_agenda = PersistentHeap()
+      self.right_agenda = PersistentHeap()
+      for formula, formula_depth in left.items():
+        self.left_agenda = self.schedule(self.left_agenda, formula,
+          formula_depth)
+      for formula, formula_depth in right.items():
+        self.right_agenda = self.schedule(self.right_agenda, formula,
+          formula_depth)
+      for formula in left:
+        self.left_index = self.left_index.insert(formula)
+      for formula in right:
+        self.right_index = self.right_index.insert(formula)
+        for formula_left in self.left_index.unifiable(formula):
+          self.addPair(formula_left, formula)
+      self.instances = PersistentMap()
+      self.blocked = None
+      if origins is None:
+        origins = ({ formula: frozenset([formula]) for formula in left },
+          { })
+      self.left_origins = PersistentMap(origins[0].items())
+      self.right_origins = PersistentMap(origins[1].items())
+    else:
+      self.hash = parent.hash
+      self.unification_terms = parent.unification_terms
+      self.left_index = parent.left_index
+      self.right_index = parent.right_index
+      self.pairs = parent.pairs
+      self.counter = parent.counter
+      self.left_agenda = parent.left_agenda
+      self.right_agenda = parent.right_agenda
+      self.instances = parent.instances
+      self.blocked = parent.blocked
+      self.left_origins = parent.left_origins
+      self.right_origins = parent.right_origins
+
+  # create a sequent with the same formulae that can be modified separately
+  def child(self, siblings):
+    return Sequent(self.left, self.right, siblings, self.depth + 1, self)
+
+  def addPair(self, formula_left, formula_right):
+    if Unifier().unify(formula_left, formula_right):
+      self.pairs = ((formula_left, formula_right), self.pairs)
+
+  # The formulae waiting to be expanded are kept in an agenda per side: a
+  # persistent heap of (depth, counter, formula) entries shared with the
+  # parent, so the next formula is found without scanning the atoms. Entries
+  # are not removed with their formula; an entry is stale once its formula
+  # is gone or has a different depth, and stale entries are dropped when
+  # they reach the top.
+  def schedule(self, agenda, formula, depth):
+    if isinstance(formula, Predicate):
+      return agenda
+    return agenda.push((depth, next(self.counter), formula))
+
+  # the shallowest expandable formula on the left and its depth, or None
+  # a quantifier already instantiated limit times on this branch is moved
+  # from the agenda to the blocked chain instead
+  def nextLeft(self, limit=None):
+    while len(self.left_agenda) > 0:
+      entry = self.left_agenda.peek()
+      depth, counter, formula = entry
+      if self.left.get(formula) == depth:
+        if limit is None or not isinstance(formula, ForAll) or \
+          self.instances.get(formula, 0) < limit:
+          return formula, depth
+        self.blocked = (('left', entry), self.blocked)
+      self.left_agenda = self.left_agenda.pop()
+    return None
+
+  def nextRight(self, limit=None):
+    while len(self.right_agenda) > 0:
+      entry = self.right_agenda.peek()
+      depth, counter, formula = entry
+      if self.right.get(formula) == depth:
+        if limit is None or not isinstance(formula, ThereExists) or \
+          self.instances.get(formula, 0) < limit:
+          return formula, depth
+        self.blocked = (('right', entry), self.blocked)
+      self.right_agenda = self.right_agenda.pop()
+    return None
+
+  # count an instantiation of a quantifier on this branch
+  def instantiate(self, formula):
+    self.instances = self.instances.set(formula,
+      self.instances.get(formula, 0) + 1)
+
+  # put the blocked quantifiers back on the agenda
+  def resume(self):
+    cell = self.blocked
+    while cell is not None:
+      side, entry = cell[0]
+      if side == 'left':
+        self.left_agenda = self.left_agenda.push(entry)
+      else:
+        self.right_agenda = self.right_agenda.push(entry)
+      cell = cell[1]
+    self.blocked = None
+
+  # add a formula; one that is derived again keeps its smaller depth (so
+  # rederiving it cannot postpone it forever) and its first origins
+  def addLeft(self, formula, depth, origins=frozenset()):
+    old_depth = self.left.get(formula)
+    if old_depth is not None and old_depth <= depth:
+      return
+    self.left_agenda = self.schedule(self.left_agenda, formula, depth)
+    if old_depth is None:
+      if len(origins) > 0:
+        self.left_origins = self.left_origins.set(formula, origins)
+      self.hash = (self.hash + leftHash(formula)) & HASH_MASK
+      self.countUnificationTerms(formula, 1)
+      if isinstance(formula, Predicate):
+        self.left_index = self.left_index.insert(formula)
+        for formula_right in self.right_index.unifiable(formula):
+          self.addPair(formula, formula_right)
+    self.left = self.left.set(formula, depth)
+
+  def addRight(self, formula, depth, origins=frozenset()):
+    old_depth = self.right.get(formula)
+    if old_depth is not None and old_depth <= depth:
+      return
+    self.right_agenda = self.schedule(self.right_agenda, formula, depth)
+    if old_depth is None:
+      if len(origins) > 0:
+        self.right_origins = self.right_origins.set(formula, origins)
+      self.hash = (self.hash + rightHash(formula)) & HASH_MASK
+      self.countUnificationTerms(formula, 1)
+      if isinstance(formula, Predicate):
+        self.right_index = self.right_index.insert(formula)
+        for formula_left in self.left_index.unifiable(formula):
+          self.addPair(formula_left, formula)
+    self.right = self.right.set(formula, depth)
+
+  # the rules never remove atoms, but removing one must drop it from the
+  # index and drop its pairs
+  def removeLeft(self, formula):
+    self.left = self.left.delete(formula)
+    if formula in self.left_origins:
+      self.left_origins = self.left_origins.delete(formula)
+    self.hash = (self.hash - leftHash(formula)) & HASH_MASK
+    self.countUnificationTerms(formula, -1)
+    if isinstance(formula, Predicate):
+      self.left_index = self.left_index.delete(formula)
+      self.invalidatePairs()
+
+  def removeRight(self, formula):
+    self.right = self.right.delete(formula)
+    if formula in self.right_origins:
+      self.right_origins = self.right_origins.delete(formula)
+    self.hash = (self.hash - rightHash(formula)) & HASH_MASK
+    self.countUnificationTerms(formula, -1)
+    if isinstance(formula, Predicate):
+      self.right_index = self.right_index.delete(formula)
+      self.invalidatePairs()
+
+  # the free unification terms are kept as a persistent map from each term
+  # to the number of formulae it occurs in, maintained from the summaries of
+  # the formulae that come and go
+  def countUnificationTerms(self, formula, delta):
+    terms = self.unification_terms
+    for term in formula.free_unification_terms:
+      count = terms.get(term, 0) + delta
+      if count > 0:
+        terms = terms.set(term, count)
+      else:
+        terms = terms.delete(term)
+    self.unification_terms = terms
+
+  def originsLeft(self, formula):
+    return self.left_origins.get(formula, frozenset())
+
+  def originsRight(self, formula):
+    return self.right_origins.get(formula, frozenset())
+
+  # the origins used by closing this sequent with the given pairs of a left
+  # and a right formula
+  def originsClosing(self, pairs):
+    result = frozenset()
+    for formula_left, formula_right in pairs:
+      result |= self.originsLeft(formula_left)
+      result |= self.originsRight(formula_right)
+    return result
+
+  def invalidatePairs(self):
+    pairs = [pair for pair in self.getUnifiablePairs()
+      if pair[0] in self.left and pair[1] in self.right]
+    self.pairs = None
+    for pair in pairs:
+      self.pairs = (pair, self.pairs)
+
   def freeVariables(self):
     result = set()
     for formula in self.left:
@@ -80,145 +501,192 @@ class Sequent:
     return result
 
   def freeUnificationTerms(self):
-    result = set()
-    for formula in self.left:
-      result |= formula.freeUnificationTerms()
-    for formula in self.right:
-      result |= formula.freeUnificationTerms()
-    return result
-
-  def getVariableName(self, prefix):
-    fv = self.freeVariables() | self.freeUnificationTerms()
-    index = 1
-    name = prefix + str(index)
-    while Variable(name) in fv or UnificationTerm(name) in fv:
-      index += 1
-      name = prefix + str(index)
-    return name
+    return set(self.unification_terms)
 
+  # the unifiable pairs, oldest first
   def getUnifiablePairs(self):
     pairs = []
-    for formula_left in self.left:
-      for formula_right in self.right:
-        if unify(formula_left, formula_right) is not None:
-          pairs.append((formula_left, formula_right))
+    cell = self.pairs
+    while cell is not None:
+      pairs.append(cell[0])
+      cell = cell[1]
+    pairs.reverse()
     return pairs
 
+  # the sides are sets, so once the hashes and sizes agree it is enough to
+  # check that one sequent's formulae all appear in the other
   def __eq__(self, other):
+    if self is other:
+      return True
+    if not isinstance(other, Sequent) or self.hash != other.hash or \
+      len(self.left) != len(other.left) or \
+      len(self.right) != len(other.right):
+      return False
     for formula in self.left:
       if formula not in other.left:
         return False
-    for formula in other.left:
-      if formula not in self.left:
-        return False
     for formula in self.right:
       if formula not in other.right:
         return False
-    for formula in other.right:
-      if formula not in self.right:
-        return False
     return True
 
   def __str__(self):
-    left_part = ', '.join([str(formula) for formula in self.left])
-    right_part = ', '.join([str(formula) for formula in self.right])
-    if left_part != '':
-      left_part = left_part + ' '
-    if right_part != '':
-      right_part = ' ' + right_part
-    return left_part + '⊢' + right_part
+    return sequentText(self.left, self.right)
 
   def __hash__(self):
-    return hash(str(self))
+    return self.hash
 
 ##############################################################################
 # Proof search
 ##############################################################################
 
-# returns True if the sequent is provable
-# returns False or loops forever if the sequent is not provable
-def proveSequent(sequent):
-  # reset the time for each formula in the sequent
-  for formula in sequent.left:
-    formula.setInstantiationTime(0)
-  for formula in sequent.right:
-    formula.setInstantiationTime(0)
+# returns a Result (see budget.py) that is true if the sequent is provable
+# without a budget, loops forever on some sequents that are not provable
+# with a budget, the result is unknown once any of its limits is exceeded
+# a proven result's used are the origins (see Sequent) of the formulae that
+# closed its branches: the formulae on the left that the proof needed
+# the scheduler is the name of a frontier policy (see scheduler.py)
+# the steps are reported to the tracer, if any (see tracer.py)
+# with deepening set to a number k, the search runs in rounds: in each round
+# a quantifier may be instantiated at most k times on a branch, and a
+# branch that needs more is suspended. If the round ends with suspended
+# branches, k grows by one and those branches carry on where they stopped,
+# so nothing proven in an earlier round is searched again.
+# a farm (see parallel.py) may take over one branch of each split of a
+# sequent without siblings, since such a branch is an independent subproof
+# with dedup set, a sequent without siblings which is the same as one met
+# before up to renaming (see canonical.py) is not expanded again: it is
+# provable exactly when the first one is
+def proveSequent(sequent, scheduler='fifo', tracer=None, budget=None,
+  deepening=None, farm=None, dedup=True):
+  if tracer is None:
+    tracer = NullTracer()
+  meter = Meter(budget)
+
+  # fresh names for instantiated quantifiers
+  symbols = SymbolAllocator(list(sequent.left) + list(sequent.right))
 
   # sequents to be proven
-  frontier = [sequent]
+  frontier = makeScheduler(scheduler)
+  frontier.push(sequent)
+
+  # sequents which have been proven, with the pairs of formulae that closed
+  # them, and the origins of those formulae
+  proven = { }
+  used = frozenset()
+
+  # the first sequent without siblings met with each canonical key (which
+  # takes the origins into account, so a duplicate would use the same ones)
+  canonical = Canonicalizer(symbols.generated) if dedup else None
+  labels = { }
+  expanded = { }
 
-  # sequents which have been proven
-  proven = { sequent }
+  def originLabel(side, sequent, formula):
+    if side == 'left':
+      origins = sequent.originsLeft(formula)
+    else:
+      origins = sequent.originsRight(formula)
+    label = labels.get(origins)
+    if label is None:
+      label = ','.join(sorted([canonical.formulaKey(origin)
+        for origin in origins]))
+      labels[origins] = label
+    return label
+
+  # sequents in the frontier whose sibling group has been closed
+  closed = 0
+
+  # the instantiation bound, and the sequents waiting for it to grow
+  limit = deepening
+  suspended = []
 
   while True:
-    # get the next sequent
-    old_sequent = None
-    while len(frontier) > 0 and (old_sequent is None or old_sequent in proven):
-      old_sequent = frontier.pop(0)
+    # get the next sequent, skipping those closed along with their siblings
+    old_sequent = frontier.pop()
+    while old_sequent is not None and old_sequent in proven:
+      if not old_sequent.waiting:
+        closed -= 1
+      old_sequent.waiting = False
+      used |= old_sequent.originsClosing(proven[old_sequent])
+      old_sequent = frontier.pop()
     if old_sequent is None:
-      break
-    print('%s. %s' % (old_sequent.depth, old_sequent))
+      # start the next round, if the bound held anything back
+      suspended = [sequent for sequent in suspended
+        if sequent not in proven]
+      if len(suspended) == 0:
+        break
+      limit += 1
+      meter.rounds += 1
+      for sequent in suspended:
+        sequent.resume()
+        sequent.waiting = True
+        frontier.push(sequent)
+      suspended = []
+      continue
+    old_sequent.waiting = False
+
+    # skip duplicates (a suspended sequent is met again when it resumes)
+    if canonical is not None and old_sequent.siblings is None:
+      key = canonical.sequentKey(old_sequent.left, old_sequent.right,
+        lambda side, formula: originLabel(side, old_sequent, formula))
+      if expanded.setdefault(key, old_sequent) is not old_sequent:
+        continue
+    reason = meter.step(len(frontier) + 1 - closed)
+    if reason is not None:
+      return meter.result(UNKNOWN, reason)
+
+    # stop as soon as a farmed branch fails
+    if farm is not None:
+      failure = farm.failure()
+      if failure is not None:
+        return meter.result(failure.status, failure.reason)
+    tracer.sequent(old_sequent)
 
     # check if this sequent is axiomatically true without unification
-    if len(set(old_sequent.left.keys()) & set(old_sequent.right.keys())) > 0:
-      proven.add(old_sequent)
+    common = set(old_sequent.left.keys()) & set(old_sequent.right.keys())
+    if len(common) > 0:
+      tracer.axiom(old_sequent)
+
+      # close it with the formula that uses the fewest origins
+      pairs = min([[(formula, formula)] for formula in common],
+        key=lambda pairs: len(old_sequent.originsClosing(pairs)))
+      proven[old_sequent] = pairs
+      used |= old_sequent.originsClosing(pairs)
+
+      # it holds under any substitution, so its siblings no longer need it
+      if old_sequent.siblings is not None:
+        old_sequent.siblings.discard(old_sequent)
       continue
 
     # check if this sequent has unification terms
     if old_sequent.siblings is not None:
       # get the unifiable pairs for each sibling
+      siblings = list(old_sequent.siblings)
       sibling_pair_lists = [sequent.getUnifiablePairs()
-        for sequent in old_sequent.siblings]
+        for sequent in siblings]
 
       # check if there is a unifiable pair for each sibling
       if all([len(pair_list) > 0 for pair_list in sibling_pair_lists]):
-        # iterate through all simultaneous choices of pairs from each sibling
-        substitution = None
-        index = [0] * len(sibling_pair_lists)
-        while True:
-          # attempt to unify at the index
-          substitution = unify_list([sibling_pair_lists[i][index[i]]
-            for i in range(len(sibling_pair_lists))])
-          if substitution is not None:
-            break
-
-          # increment the index
-          pos = len(sibling_pair_lists) - 1
-          while pos >= 0:
-            index[pos] += 1
-            if index[pos] < len(sibling_pair_lists[pos]):
-              break
-            index[pos] = 0
-            pos -= 1
-          if pos < 0:
-            break
-        if substitution is not None:
-          for k, v in substitution.items():
-            print('  %s = %s' % (k, v))
-          proven |= old_sequent.siblings
-          frontier = [sequent for sequent in frontier
-            if sequent not in old_sequent.siblings]
+        # search for a simultaneous choice of pairs from each sibling
+        solution = unify_choices(sibling_pair_lists,
+          meter=meter)
+        if solution is not None:
+          unifier, choices = solution
+          tracer.unified(old_sequent, unifier)
+          for sibling, pair in zip(siblings, choices):
+            if sibling.waiting:
+              sibling.waiting = False
+              closed += 1
+            proven[sibling] = [pair]
+            used |= sibling.originsClosing([pair])
           continue
-      else:
-        # unlink this sequent
-        old_sequent.siblings.remove(old_sequent)
 
     while True:
       # determine which formula to expand
-      left_formula = None
-      left_depth = None
-      for formula, depth in old_sequent.left.items():
-        if left_depth is None or left_depth > depth:
-          if not isinstance(formula, Predicate):
-            left_formula = formula
-            left_depth = depth
-      right_formula = None
-      right_depth = None
-      for formula, depth in old_sequent.right.items():
-        if right_depth is None or right_depth > depth:
-          if not isinstance(formula, Predicate):
-            right_formula = formula
-            right_depth = depth
+      left_formula, left_depth = old_sequent.nextLeft(limit) or \
+        (None, None)
+      right_formula, right_depth = old_sequent.nextRight(limit) or \
+        (None, None)
       apply_left = False
       apply_right = False
       if left_formula is not None and right_formula is None:
@@ -231,249 +699,275 @@ def proveSequent(sequent):
         else:
           apply_right = True
       if left_formula is None and right_formula is None:
-        return False
+        if old_sequent.blocked is not None:
+          suspended.append(old_sequent)
+          break
+        return meter.result(UNPROVABLE)
+
+      # the sequent is replaced in its sibling group by its children
+      if old_sequent.siblings is not None:
+        old_sequent.siblings.discard(old_sequent)
 
       # apply a left rule
       if apply_left:
+        tracer.rule(old_sequent, 'left', left_formula)
+        origins = old_sequent.originsLeft(left_formula)
         if isinstance(left_formula, Not):
-          new_sequent = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent.left[left_formula]
-          new_sequent.right[left_formula.formula] = \
-          old_sequent.left[left_formula] + 1
+          new_sequent = old_sequent.child(old_sequent.siblings)
+          new_sequent.removeLeft(left_formula)
+          new_sequent.addRight(left_formula.formula,
+            old_sequent.left[left_formula] + 1, origins)
           if new_sequent.siblings is not None:
             new_sequent.siblings.add(new_sequent)
-          frontier.append(new_sequent)
+          frontier.push(new_sequent)
           break
         if isinstance(left_formula, And):
-          new_sequent = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent.left[left_formula]
-          new_sequent.left[left_formula.formula_a] = \
-            old_sequent.left[left_formula] + 1
-          new_sequent.left[left_formula.formula_b] = \
-          old_sequent.left[left_formula] + 1
+          new_sequent = old_sequent.child(old_sequent.siblings)
+          new_sequent.removeLeft(left_formula)
+          new_sequent.addLeft(left_formula.formula_a,
+            old_sequent.left[left_formula] + 1, origins)
+          new_sequent.addLeft(left_formula.formula_b,
+            old_sequent.left[left_formula] + 1, origins)
           if new_sequent.siblings is not None:
             new_sequent.siblings.add(new_sequent)
-          frontier.append(new_sequent)
+          frontier.push(new_sequent)
           break
         if isinstance(left_formula, Or):
-          new_sequent_a = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          new_sequent_b = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent_a.left[left_formula]
-          del new_sequent_b.left[left_formula]
-          new_sequent_a.left[left_formula.formula_a] = \
-            old_sequent.left[left_formula] + 1
-          new_sequent_b.left[left_formula.formula_b] = \
-          old_sequent.left[left_formula] + 1
+          new_sequent_a = old_sequent.child(old_sequent.siblings)
+          new_sequent_b = old_sequent.child(old_sequent.siblings)
+          new_sequent_a.removeLeft(left_formula)
+          new_sequent_b.removeLeft(left_formula)
+          new_sequent_a.addLeft(left_formula.formula_a,
+            old_sequent.left[left_formula] + 1, origins)
+          new_sequent_b.addLeft(left_formula.formula_b,
+            old_sequent.left[left_formula] + 1, origins)
           if new_sequent_a.siblings is not None:
             new_sequent_a.siblings.add(new_sequent_a)
-          frontier.append(new_sequent_a)
+          frontier.push(new_sequent_a)
           if new_sequent_b.siblings is not None:
             new_sequent_b.siblings.add(new_sequent_b)
-          frontier.append(new_sequent_b)
+          if farm is None or not farm.submit(new_sequent_b):
+            frontier.push(new_sequent_b)
           break
         if isinstance(left_formula, Implies):
-          new_sequent_a = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          new_sequent_b = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent_a.left[left_formula]
-          del new_sequent_b.left[left_formula]
-          new_sequent_a.right[left_formula.formula_a] = \
-            old_sequent.left[left_formula] + 1
-          new_sequent_b.left[left_formula.formula_b] = \
-          old_sequent.left[left_formula] + 1
+          new_sequent_a = old_sequent.child(old_sequent.siblings)
+          new_sequent_b = old_sequent.child(old_sequent.siblings)
+          new_sequent_a.removeLeft(left_formula)
+          new_sequent_b.removeLeft(left_formula)
+          new_sequent_a.addRight(left_formula.formula_a,
+            old_sequent.left[left_formula] + 1, origins)
+          new_sequent_b.addLeft(left_formula.formula_b,
+            old_sequent.left[left_formula] + 1, origins)
           if new_sequent_a.siblings is not None:
             new_sequent_a.siblings.add(new_sequent_a)
-          frontier.append(new_sequent_a)
+          frontier.push(new_sequent_a)
           if new_sequent_b.siblings is not None:
             new_sequent_b.siblings.add(new_sequent_b)
-          frontier.append(new_sequent_b)
+          if farm is None or not farm.submit(new_sequent_b):
+            frontier.push(new_sequent_b)
           break
         if isinstance(left_formula, ForAll):
-          new_sequent = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings or set(),
-            old_sequent.depth + 1
-          )
-          new_sequent.left[left_formula] += 1
+          new_sequent = old_sequent.child(old_sequent.siblings or set())
+          new_sequent.removeLeft(left_formula)
+          new_sequent.addLeft(left_formula,
+            old_sequent.left[left_formula] + 1, origins)
+          new_sequent.instantiate(left_formula)
           formula = left_formula.formula.replace(
             left_formula.variable,
-            UnificationTerm(old_sequent.getVariableName('t'))
+            symbols.unificationTerm(old_sequent.depth + 1)
           )
-          formula.setInstantiationTime(old_sequent.depth + 1)
           if formula not in new_sequent.left:
-            new_sequent.left[formula] = new_sequent.left[left_formula]
+            new_sequent.addLeft(formula, new_sequent.left[left_formula],
+              origins)
           if new_sequent.siblings is not None:
             new_sequent.siblings.add(new_sequent)
-          frontier.append(new_sequent)
+          frontier.push(new_sequent)
           break
         if isinstance(left_formula, ThereExists):
-          new_sequent = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent.left[left_formula]
-          variable = Variable(old_sequent.getVariableName('v'))
+          new_sequent = old_sequent.child(old_sequent.siblings)
+          new_sequent.removeLeft(left_formula)
+          variable = symbols.variable(old_sequent.depth + 1)
           formula = left_formula.formula.replace(left_formula.variable,
             variable)
-          formula.setInstantiationTime(old_sequent.depth + 1)
-          new_sequent.left[formula] = old_sequent.left[left_formula] + 1
+          new_sequent.addLeft(formula, old_sequent.left[left_formula] + 1,
+            origins)
           if new_sequent.siblings is not None:
             new_sequent.siblings.add(new_sequent)
-          frontier.append(new_sequent)
+          frontier.push(new_sequent)
           break
 
       # apply a right rule
       if apply_right:
+        tracer.rule(old_sequent, 'right', right_formula)
+        origins = old_sequent.originsRight(right_formula)
         if isinstance(right_formula, Not):
-          new_sequent = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent.right[right_formula]
-          new_sequent.left[right_formula.formula] = \
-          old_sequent.right[right_formula] + 1
+          new_sequent = old_sequent.child(old_sequent.siblings)
+          new_sequent.removeRight(right_formula)
+          new_sequent.addLeft(right_formula.formula,
+            old_sequent.right[right_formula] + 1, origins)
           if new_sequent.siblings is not None:
             new_sequent.siblings.add(new_sequent)
-          frontier.append(new_sequent)
+          frontier.push(new_sequent)
           break
         if isinstance(right_formula, And):
-          new_sequent_a = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          new_sequent_b = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent_a.right[right_formula]
-          del new_sequent_b.right[right_formula]
-          new_sequent_a.right[right_formula.formula_a] = \
-            old_sequent.right[right_formula] + 1
-          new_sequent_b.right[right_formula.formula_b] = \
-          old_sequent.right[right_formula] + 1
+          new_sequent_a = old_sequent.child(old_sequent.siblings)
+          new_sequent_b = old_sequent.child(old_sequent.siblings)
+          new_sequent_a.removeRight(right_formula)
+          new_sequent_b.removeRight(right_formula)
+          new_sequent_a.addRight(right_formula.formula_a,
+            old_sequent.right[right_formula] + 1, origins)
+          new_sequent_b.addRight(right_formula.formula_b,
+            old_sequent.right[right_formula] + 1, origins)
           if new_sequent_a.siblings is not None:
             new_sequent_a.siblings.add(new_sequent_a)
-          frontier.append(new_sequent_a)
+          frontier.push(new_sequent_a)
           if new_sequent_b.siblings is not None:
             new_sequent_b.siblings.add(new_sequent_b)
-          frontier.append(new_sequent_b)
+          if farm is None or not farm.submit(new_sequent_b):
+            frontier.push(new_sequent_b)
           break
         if isinstance(right_formula, Or):
-          new_sequent = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent.right[right_formula]
-          new_sequent.right[right_formula.formula_a] = \
-            old_sequent.right[right_formula] + 1
-          new_sequent.right[right_formula.formula_b] = \
-            old_sequent.right[right_formula] + 1
+          new_sequent = old_sequent.child(old_sequent.siblings)
+          new_sequent.removeRight(right_formula)
+          new_sequent.addRight(right_formula.formula_a,
+            old_sequent.right[right_formula] + 1, origins)
+          new_sequent.addRight(right_formula.formula_b,
+            old_sequent.right[right_formula] + 1, origins)
           if new_sequent.siblings is not None:
             new_sequent.siblings.add(new_sequent)
-          frontier.append(new_sequent)
+          frontier.push(new_sequent)
           break
         if isinstance(right_formula, Implies):
-          new_sequent = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent.right[right_formula]
-          new_sequent.left[right_formula.formula_a] = \
-            old_sequent.right[right_formula] + 1
-          new_sequent.right[right_formula.formula_b] = \
-            old_sequent.right[right_formula] + 1
+          new_sequent = old_sequent.child(old_sequent.siblings)
+          new_sequent.removeRight(right_formula)
+          new_sequent.addLeft(right_formula.formula_a,
+            old_sequent.right[right_formula] + 1, origins)
+          new_sequent.addRight(right_formula.formula_b,
+            old_sequent.right[right_formula] + 1, origins)
           if new_sequent.siblings is not None:
             new_sequent.siblings.add(new_sequent)
-          frontier.append(new_sequent)
+          frontier.push(new_sequent)
           break
         if isinstance(right_formula, ForAll):
-          new_sequent = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings,
-            old_sequent.depth + 1
-          )
-          del new_sequent.right[right_formula]
-          variable = Variable(old_sequent.getVariableName('v'))
+          new_sequent = old_sequent.child(old_sequent.siblings)
+          new_sequent.removeRight(right_formula)
+          variable = symbols.variable(old_sequent.depth + 1)
           formula = right_formula.formula.replace(right_formula.variable,
             variable)
-          formula.setInstantiationTime(old_sequent.depth + 1)
-          new_sequent.right[formula] = old_sequent.right[right_formula] + 1
+          new_sequent.addRight(formula,
+            old_sequent.right[right_formula] + 1, origins)
           if new_sequent.siblings is not None:
             new_sequent.siblings.add(new_sequent)
-          frontier.append(new_sequent)
+          frontier.push(new_sequent)
           break
         if isinstance(right_formula, ThereExists):
-          new_sequent = Sequent(
-            old_sequent.left.copy(),
-            old_sequent.right.copy(),
-            old_sequent.siblings or set(),
-            old_sequent.depth + 1
-          )
-          new_sequent.right[right_formula] += 1
+          new_sequent = old_sequent.child(old_sequent.siblings or set())
+          new_sequent.removeRight(right_formula)
+          new_sequent.addRight(right_formula,
+            old_sequent.right[right_formula] + 1, origins)
+          new_sequent.instantiate(right_formula)
           formula = right_formula.formula.replace(
             right_formula.variable,
-            UnificationTerm(old_sequent.getVariableName('t'))
+            symbols.unificationTerm(old_sequent.depth + 1)
           )
-          formula.setInstantiationTime(old_sequent.depth + 1)
           if formula not in new_sequent.right:
-            new_sequent.right[formula] = new_sequent.right[right_formula]
+            new_sequent.addRight(formula, new_sequent.right[right_formula],
+              origins)
           if new_sequent.siblings is not None:
             new_sequent.siblings.add(new_sequent)
-          frontier.append(new_sequent)
+          frontier.push(new_sequent)
           break
 
-  # no more sequents to prove
-  return True
+  # no more sequents to prove here; wait for the farmed branches
+  if farm is not None:
+    failure = farm.wait()
+    if failure is not None:
+      return meter.result(failure.status, failure.reason)
+    used |= farm.used
+  return meter.result(PROVEN, used=used)
+
+# returns a Result as for proveSequent
+# pass a TermBank to run the proof on array-backed terms instead of objects
+# pass a ProofCache (see cache.py) to reuse and record results
+# a proof's used are the axioms it needed
+# pass a relevance filter (see relevance.py) to first try to prove the
+# formula from the axioms it selects, within the filter's own budget (and
+# the given one) and without the farm; if that fails, the formula is proven
+# from all the axioms with what is left of the given budget, and the stats
+# of the two attempts are added up; the tracer only sees the steps of the
+# attempt if it succeeds
+# with sat set, a problem without quantifiers is decided by the SAT solver
+# instead (see sat.py) within the budget; the proof search is then only run
+# to show the steps to the tracer, if there is one, starting from the
+# axioms the solver found necessary. That search can take exponentially
+# many steps, so it gets at most REPLAY_STEPS of them (and what is left of
+# the budget), and the tracer sees nothing if it runs out; stats['traced']
+# says whether the tracer was given the steps.
+REPLAY_STEPS = 1000
+
+def proveFormula(axioms, formula, bank=None, scheduler='fifo', tracer=None,
+  budget=None, deepening=None, farm=None, cache=None, dedup=True,
+  relevance=None, sat=True):
+  if cache is not None:
+    result = cache.get(axioms, formula, budget)
+    if result is not None:
+      return result
+  if sat and isQuantifierFree(formula) and \
+    all([isQuantifierFree(axiom) for axiom in axioms]):
+    result = provePropositional(axioms, formula, budget)
+    if tracer is not None and result.status != UNKNOWN:
+      replay_budget = Budget(steps=REPLAY_STEPS)
+      if budget is not None:
+        replay_budget = replay_budget.tighter(budget.remaining(result.stats))
+      buffer = BufferTracer()
+      replay = proveAxioms(list(axioms if result.used is None else
+        result.used), formula, bank, scheduler, buffer, replay_budget, None,
+        None, dedup)
+      result.stats['traced'] = replay.status == result.status
+      if result.stats['traced']:
+        buffer.replay(tracer)
+    if cache is not None:
+      cache.put(axioms, formula, result, budget)
+    return result
+  attempt = None
+  if relevance is not None:
+    selected = relevance.select(axioms, formula)
+    if len(selected) < len(axioms):
+      buffer = BufferTracer() if tracer is not None else None
+      attempt = proveAxioms(selected, formula, bank, scheduler, buffer,
+        relevance.budget.tighter(budget), deepening, None, dedup)
+      attempt.stats['relevant'] = len(selected)
+      if attempt and buffer is not None:
+        buffer.replay(tracer)
+  if attempt is not None and attempt:
+    result = attempt
+  else:
+    if attempt is not None and budget is not None:
+      budget = budget.remaining(attempt.stats)
+    result = proveAxioms(axioms, formula, bank, scheduler, tracer, budget,
+      deepening, farm, dedup)
+    if attempt is not None:
+      for name in ('steps', 'seconds', 'unifications'):
+        result.stats[name] += attempt.stats[name]
+      result.stats['frontier'] = max(result.stats['frontier'],
+        attempt.stats['frontier'])
+      result.stats['relevant'] = attempt.stats['relevant']
+  if cache is not None:
+    cache.put(axioms, formula, result, budget)
+  return result
 
-# returns True if the formula is provable
-# returns False or loops forever if the formula is not provable
-def proveFormula(axioms, formula):
-  return proveSequent(Sequent(
+def proveAxioms(axioms, formula, bank, scheduler, tracer, budget, deepening,
+  farm, dedup):
+  if bank is not None:
+    loaded = { bank.load(axiom): axiom for axiom in axioms }
+    axioms = list(loaded)
+    formula = bank.load(formula)
+  result = proveSequent(Sequent(
     { axiom: 0 for axiom in axioms },
     { formula: 0 },
     None,
     0
-  ))
+  ), scheduler, tracer, budget, deepening, farm, dedup)
+  if bank is not None and result.used is not None:
+    result.used = frozenset([loaded[axiom] for axiom in result.used])
+  return result
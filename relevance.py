@@ -0,0 +1,108 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+from language import *
+from budget import *
+
+##############################################################################
+# Axiom relevance
+##############################################################################
+
+# With many axioms, most of them have nothing to do with a given goal, but
+# the prover still instantiates every quantified one. A relevance filter
+# picks the axioms likely to matter so the prover can try those first.
+#
+# SineFilter follows SInE: a symbol (a predicate, a function or a constant)
+# triggers an axiom if it occurs in the axiom and is among the axiom's
+# rarest symbols, i.e. it occurs in at most tolerance times as many axioms
+# as the rarest one. Starting from the symbols of the goal, the axioms
+# triggered by selected symbols are selected, and their symbols are
+# selected in turn, until nothing changes or depth rounds have been done.
+#
+# The selection may leave out an axiom the proof needs, so failing to prove
+# the goal from it proves nothing. A failed attempt is only worth making
+# with a budget, which is why the filter carries one for it. The attempt is
+# also held to the caller's budget, and what it uses is taken out of the
+# budget left for the proof from all the axioms.
+
+# the names of the predicates, functions and constants (free variables) in
+# a formula
+def formulaSymbols(formula):
+  result = set([variable.name for variable in formula.freeVariables()])
+  addSymbols(formula, result)
+  return frozenset(result)
+
+def addSymbols(node, result):
+  if isinstance(node, Function) or isinstance(node, Predicate):
+    result.add(node.name)
+    for term in node.terms:
+      addSymbols(term, result)
+  elif isinstance(node, Not):
+    addSymbols(node.formula, result)
+  elif isinstance(node, ForAll) or isinstance(node, ThereExists):
+    addSymbols(node.formula, result)
+  elif isinstance(node, And) or isinstance(node, Or) or \
+    isinstance(node, Implies):
+    addSymbols(node.formula_a, result)
+    addSymbols(node.formula_b, result)
+
+class SineFilter:
+  def __init__(self, tolerance=1.5, depth=None, budget=None):
+    self.tolerance = tolerance
+    self.depth = depth
+
+    # the budget of the attempt with the selected axioms
+    if budget is None:
+      budget = Budget(steps=10000)
+    self.budget = budget
+
+    # the symbols of the formulae seen so far
+    self.symbols = { }
+
+  def formulaSymbols(self, formula):
+    symbols = self.symbols.get(formula)
+    if symbols is None:
+      symbols = formulaSymbols(formula)
+      self.symbols[formula] = symbols
+    return symbols
+
+  # the axioms relevant to the formula, in the order given
+  def select(self, axioms, formula):
+    axioms = list(axioms)
+
+    # the number of axioms each symbol occurs in
+    occurrences = { }
+    for axiom in axioms:
+      for symbol in self.formulaSymbols(axiom):
+        occurrences[symbol] = occurrences.get(symbol, 0) + 1
+
+    # the axioms each symbol triggers
+    triggers = { }
+    for axiom in axioms:
+      symbols = self.formulaSymbols(axiom)
+      if len(symbols) == 0:
+        continue
+      rarest = min([occurrences[symbol] for symbol in symbols])
+      for symbol in symbols:
+        if occurrences[symbol] <= self.tolerance * rarest:
+          triggers.setdefault(symbol, []).append(axiom)
+
+    selected = set()
+    seen = set(self.formulaSymbols(formula))
+    symbols = list(seen)
+    rounds = 0
+    while len(symbols) > 0 and (self.depth is None or rounds < self.depth):
+      new_symbols = []
+      for symbol in symbols:
+        for axiom in triggers.get(symbol, []):
+          if axiom not in selected:
+            selected.add(axiom)
+            for new_symbol in self.formulaSymbols(axiom):
+              if new_symbol not in seen:
+                seen.add(new_symbol)
+                new_symbols.append(new_symbol)
+      symbols = new_symbols
+      rounds += 1
+    return [axiom for axiom in axioms if axiom in selected]
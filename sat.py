@@ -0,0 +1,526 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+import heapq
+import time
+from language import *
+from budget import *
+
+##############################################################################
+# SAT solver
+##############################################################################
+
+# A conflict-driven clause learning SAT solver. Variables are numbered from
+# 1 and a literal is a variable or its negation (-v). Clauses are watched by
+# two of their literals, so only the clauses watching a literal that became
+# false are looked at. A conflict is analyzed back to its first unique
+# implication point, the learned clause is added and the search jumps back
+# to the level where that clause asserts a literal. Decisions pick the
+# unassigned variable with the highest activity (VSIDS: the variables in
+# recent conflicts are bumped, and older bumps decay), with its last value,
+# and the search restarts after a number of conflicts that follows the Luby
+# sequence. When there are too many learned clauses, the longer half of them
+# is deleted.
+#
+# Each clause has origins: a set of labels given when it is added. A learned
+# clause gets the origins of the clauses it was resolved from (including
+# the reasons of the literals fixed at level 0), so when the clauses cannot
+# all hold, the origins of the final conflict label the clauses it needed.
+
+RESTART_INTERVAL = 100
+ACTIVITY_DECAY = 0.95
+
+# the i-th term (from 0) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, ...
+def luby(i):
+  size = 1
+  exponent = 0
+  while size < i + 1:
+    exponent += 1
+    size = 2 * size + 1
+  while size - 1 != i:
+    size = (size - 1) // 2
+    exponent -= 1
+    i = i % size
+  return 2 ** exponent
+
+class Solver:
+  def __init__(self):
+    self.clauses = []
+    self.origins = []
+    self.watches = { }
+
+    # the learned clauses, and how many are kept before half are deleted
+    self.learned = []
+    self.max_learned = 2000
+
+    # per variable (index 0 is unused): the value (1, -1 or 0 if it is
+    # unassigned), decision level, reason clause (or None), activity, the
+    # value it had last and whether the order heap has an entry for it with
+    # its current activity
+    self.values = [0]
+    self.levels = [0]
+    self.reasons = [None]
+    self.activity = [0.0]
+    self.phases = [-1]
+    self.queued = [False]
+
+    # the origins of the variables fixed at level 0
+    self.facts = { }
+
+    self.trail = []
+    self.trail_limits = []
+    self.head = 0
+    self.order = []
+    self.increment = 1.0
+
+    # the origins of the conflict, once the clauses cannot all hold
+    self.core = None
+
+    # the name of the limit that stopped the last search, if one did
+    self.stopped = None
+
+    self.decisions = 0
+    self.conflicts = 0
+    self.restarts = 0
+
+  def newVariable(self):
+    self.values.append(0)
+    self.levels.append(0)
+    self.reasons.append(None)
+    self.activity.append(0.0)
+    self.phases.append(-1)
+    self.queued.append(False)
+    variable = len(self.values) - 1
+    self.watches[variable] = []
+    self.watches[-variable] = []
+    self.enqueue(variable)
+    return variable
+
+  # the decision order is a heap of (-activity, variable) entries; an entry
+  # is stale once the activity of its variable has changed
+  def enqueue(self, variable):
+    heapq.heappush(self.order, (-self.activity[variable], variable))
+    self.queued[variable] = True
+
+  def value(self, literal):
+    if literal > 0:
+      return self.values[literal]
+    return -self.values[-literal]
+
+  def level(self):
+    return len(self.trail_limits)
+
+  # clauses are added before solving (at level 0), so literals that are
+  # already true or false are final
+  def addClause(self, literals, origins=frozenset()):
+    self.backtrack(0)
+    if self.core is not None:
+      return
+    clause = []
+    for literal in literals:
+      if -literal in clause or self.value(literal) == 1:
+        return
+      if self.value(literal) == -1:
+        origins = origins | self.facts[abs(literal)]
+      elif literal not in clause:
+        clause.append(literal)
+    if len(clause) == 0:
+      self.core = origins
+    elif len(clause) == 1:
+      self.assign(clause[0], self.store(clause, origins))
+      conflict = self.propagate()
+      if conflict is not None:
+        self.core = self.conflictOrigins(conflict)
+    else:
+      self.attach(self.store(clause, origins))
+
+  def store(self, clause, origins):
+    self.clauses.append(clause)
+    self.origins.append(origins)
+    return len(self.clauses) - 1
+
+  def attach(self, index):
+    clause = self.clauses[index]
+    self.watches[clause[0]].append(index)
+    self.watches[clause[1]].append(index)
+    return index
+
+  def assign(self, literal, reason):
+    variable = abs(literal)
+    self.values[variable] = 1 if literal > 0 else -1
+    self.levels[variable] = self.level()
+    self.reasons[variable] = reason
+    self.trail.append(literal)
+    if self.level() == 0:
+      self.facts[variable] = self.conflictOrigins(reason)
+
+  # the origins of a clause together with those of its literals that are
+  # fixed at level 0 (all but the first, for a reason)
+  def conflictOrigins(self, index):
+    origins = self.origins[index]
+    for literal in self.clauses[index]:
+      facts = self.facts.get(abs(literal))
+      if facts is not None and not facts <= origins:
+        origins = origins | facts
+    return origins
+
+  # returns the index of a conflicting clause, or None
+  # (this is where the solver spends its time, so value is inlined)
+  def propagate(self):
+    values = self.values
+    while self.head < len(self.trail):
+      false_literal = -self.trail[self.head]
+      self.head += 1
+      watching = self.watches[false_literal]
+      self.watches[false_literal] = kept = []
+      i = 0
+      while i < len(watching):
+        index = watching[i]
+        i += 1
+        clause = self.clauses[index]
+
+        # deleted clauses are dropped from the watches as they are met
+        if clause is None:
+          continue
+
+        # make the false literal the second watch
+        if clause[0] == false_literal:
+          clause[0], clause[1] = clause[1], clause[0]
+        first = clause[0]
+        value = values[first] if first > 0 else -values[-first]
+        if value == 1:
+          kept.append(index)
+          continue
+
+        # look for another literal to watch
+        for k in range(2, len(clause)):
+          other = clause[k]
+          if (values[other] if other > 0 else -values[-other]) != -1:
+            clause[1], clause[k] = other, clause[1]
+            self.watches[other].append(index)
+            break
+        else:
+          kept.append(index)
+          if value == -1:
+            kept.extend(watching[i:])
+            return index
+          self.assign(first, index)
+    return None
+
+  def bump(self, variable):
+    self.activity[variable] += self.increment
+    if self.activity[variable] > 1e100:
+      for other in range(1, len(self.activity)):
+        self.activity[other] *= 1e-100
+      self.increment *= 1e-100
+      self.order = []
+      for other in range(1, len(self.values)):
+        self.queued[other] = False
+        if self.values[other] == 0:
+          self.enqueue(other)
+    elif self.values[variable] == 0:
+      self.enqueue(variable)
+    else:
+      self.queued[variable] = False
+
+  # the learned clause (asserting its first literal), its origins and the
+  # level to jump back to, using the first unique implication point
+  def analyze(self, conflict):
+    seen = set()
+    learned = [None]
+    origins = set()
+    pending = 0
+    literal = None
+    index = len(self.trail) - 1
+    reason = conflict
+    while True:
+      clause = self.clauses[reason]
+      origins |= self.origins[reason]
+      for other in (clause if literal is None else clause[1:]):
+        variable = abs(other)
+        if variable in seen:
+          continue
+        seen.add(variable)
+        if self.levels[variable] == 0:
+          origins |= self.facts[variable]
+          continue
+        self.bump(variable)
+        if self.levels[variable] == self.level():
+          pending += 1
+        else:
+          learned.append(other)
+      while abs(self.trail[index]) not in seen:
+        index -= 1
+      literal = self.trail[index]
+      index -= 1
+      pending -= 1
+      if pending == 0:
+        break
+      reason = self.reasons[abs(literal)]
+    learned[0] = -literal
+    self.increment /= ACTIVITY_DECAY
+
+    # watch the literal from the highest level after the asserting one
+    level = 0
+    if len(learned) > 1:
+      highest = max(range(1, len(learned)),
+        key=lambda i: self.levels[abs(learned[i])])
+      learned[1], learned[highest] = learned[highest], learned[1]
+      level = self.levels[abs(learned[1])]
+    return learned, frozenset(origins), level
+
+  # delete the longer half of the learned clauses, except those that are
+  # the reasons of assigned literals
+  def reduce(self):
+    self.learned.sort(key=lambda index: len(self.clauses[index]))
+    kept = self.learned[:len(self.learned) // 2]
+    for index in self.learned[len(self.learned) // 2:]:
+      variable = abs(self.clauses[index][0])
+      if self.reasons[variable] == index and self.values[variable] != 0:
+        kept.append(index)
+      else:
+        self.clauses[index] = None
+        self.origins[index] = None
+    self.learned = kept
+    self.max_learned += self.max_learned // 10
+
+  def backtrack(self, level):
+    if self.level() <= level:
+      return
+    for i in range(len(self.trail) - 1, self.trail_limits[level] - 1, -1):
+      literal = self.trail[i]
+      variable = abs(literal)
+      self.values[variable] = 0
+      self.reasons[variable] = None
+      self.phases[variable] = 1 if literal > 0 else -1
+      if not self.queued[variable]:
+        self.enqueue(variable)
+    del self.trail[self.trail_limits[level]:]
+    del self.trail_limits[level:]
+    self.head = len(self.trail)
+
+  def pickBranch(self):
+    while len(self.order) > 0:
+      activity, variable = heapq.heappop(self.order)
+      if -activity != self.activity[variable]:
+        continue
+      self.queued[variable] = False
+      if self.values[variable] == 0:
+        return variable * self.phases[variable]
+    for variable in range(1, len(self.values)):
+      if self.values[variable] == 0:
+        return variable * self.phases[variable]
+    return None
+
+  # returns True if the clauses can all hold (see model), or False if they
+  # cannot (see core)
+  # returns whether the clauses can all hold, or None if the meter's budget
+  # ran out first (its name is then in stopped); each round of propagation,
+  # which ends in a conflict, a restart or a decision, is a step
+  def solve(self, meter=None):
+    if self.core is not None:
+      return False
+    restart = 0
+    limit = RESTART_INTERVAL * luby(restart)
+    conflicts = 0
+    while True:
+      conflict = self.propagate()
+      if meter is not None:
+        self.stopped = meter.step(0)
+        if self.stopped is not None:
+          return None
+      if conflict is not None:
+        self.conflicts += 1
+        conflicts += 1
+        if self.level() == 0:
+          self.core = self.conflictOrigins(conflict)
+          return False
+        learned, origins, level = self.analyze(conflict)
+        self.backtrack(level)
+        index = self.store(learned, origins)
+        if len(learned) > 1:
+          self.attach(index)
+          self.learned.append(index)
+        self.assign(learned[0], index)
+        if len(self.learned) > self.max_learned:
+          self.reduce()
+        continue
+
+      if conflicts >= limit:
+        self.restarts += 1
+        restart += 1
+        limit = RESTART_INTERVAL * luby(restart)
+        conflicts = 0
+        self.backtrack(0)
+        continue
+
+      literal = self.pickBranch()
+      if literal is None:
+        return True
+      self.decisions += 1
+      self.trail_limits.append(len(self.trail))
+      self.assign(literal, None)
+
+  # the value of each variable in the satisfying assignment just found
+  def model(self):
+    return [value == 1 for value in self.values]
+
+##############################################################################
+# Tseitin encoding
+##############################################################################
+
+# A Tseitin encoding gives each atom and connective of a quantifier-free
+# formula a variable, with clauses making the variable of each connective
+# equivalent to that connective applied to its operands. Negation needs no
+# variable. Formulae are hash-consed, so a shared subformula is encoded once.
+#
+# A formula that must hold is split into clauses directly as far as its
+# conjunctions and disjunctions go (so a problem already in clausal form
+# needs no new variables), and only the subformulae below that get
+# variables of their own.
+class Encoder:
+  def __init__(self, solver):
+    self.solver = solver
+    self.literals = { }
+    self.atoms = { }
+
+  # the literal that is true exactly when the formula is
+  def literal(self, formula):
+    # encode the operands before the connectives, without recursion
+    stack = [(formula, False)]
+    while len(stack) > 0:
+      node, expanded = stack.pop()
+      if node in self.literals:
+        continue
+      if isinstance(node, Predicate):
+        variable = self.solver.newVariable()
+        self.atoms[variable] = node
+        self.literals[node] = variable
+      elif isinstance(node, Not):
+        if expanded:
+          self.literals[node] = -self.literals[node.formula]
+        else:
+          stack.append((node, True))
+          stack.append((node.formula, False))
+      elif isinstance(node, And) or isinstance(node, Or) or \
+        isinstance(node, Implies):
+        if expanded:
+          self.define(node)
+        else:
+          stack.append((node, True))
+          stack.append((node.formula_b, False))
+          stack.append((node.formula_a, False))
+      else:
+        raise ValueError('not quantifier-free: %s' % node)
+    return self.literals[formula]
+
+  # add clauses (with the given origins) that hold exactly when the formula
+  # does, or its negation if positive is not set
+  def require(self, formula, origins, positive=True):
+    stack = [(formula, positive)]
+    while len(stack) > 0:
+      node, positive = stack.pop()
+      if isinstance(node, Not):
+        stack.append((node.formula, not positive))
+      elif isinstance(node, And if positive else Or):
+        stack.append((node.formula_a, positive))
+        stack.append((node.formula_b, positive))
+      elif isinstance(node, Implies) and not positive:
+        stack.append((node.formula_a, True))
+        stack.append((node.formula_b, False))
+      else:
+        self.solver.addClause(self.disjuncts(node, positive), origins)
+
+  # the literals of a clause that holds exactly when the formula does (or
+  # its negation, if positive is not set)
+  def disjuncts(self, formula, positive):
+    clause = []
+    stack = [(formula, positive)]
+    while len(stack) > 0:
+      node, positive = stack.pop()
+      if isinstance(node, Not):
+        stack.append((node.formula, not positive))
+      elif isinstance(node, Or if positive else And):
+        stack.append((node.formula_b, positive))
+        stack.append((node.formula_a, positive))
+      elif isinstance(node, Implies) and positive:
+        stack.append((node.formula_b, True))
+        stack.append((node.formula_a, False))
+      else:
+        literal = self.literal(node)
+        clause.append(literal if positive else -literal)
+    return clause
+
+  def define(self, node):
+    literal = self.solver.newVariable()
+    a = self.literals[node.formula_a]
+    b = self.literals[node.formula_b]
+    if isinstance(node, And):
+      self.solver.addClause([-literal, a])
+      self.solver.addClause([-literal, b])
+      self.solver.addClause([literal, -a, -b])
+    elif isinstance(node, Or):
+      self.solver.addClause([-literal, a, b])
+      self.solver.addClause([literal, -a])
+      self.solver.addClause([literal, -b])
+    else:
+      self.solver.addClause([-literal, -a, b])
+      self.solver.addClause([literal, a])
+      self.solver.addClause([literal, -b])
+    self.literals[node] = literal
+
+##############################################################################
+# Propositional proofs
+##############################################################################
+
+# whether a formula has no quantifiers
+def isQuantifierFree(formula):
+  stack = [formula]
+  while len(stack) > 0:
+    node = stack.pop()
+    if isinstance(node, ForAll) or isinstance(node, ThereExists):
+      return False
+    if isinstance(node, Not):
+      stack.append(node.formula)
+    elif isinstance(node, And) or isinstance(node, Or) or \
+      isinstance(node, Implies):
+      stack.append(node.formula_a)
+      stack.append(node.formula_b)
+  return True
+
+# Decides a quantifier-free problem: the formula follows from the axioms
+# exactly when the axioms and the negated formula cannot all hold. The
+# clauses of each axiom have that axiom as their origin, so a proof reports
+# the axioms in the final conflict as used. Otherwise the result's
+# counterexample maps each atom to its value in an assignment that makes the
+# axioms true and the formula false. The answer is definitive unless the
+# budget (see budget.py) runs out first, where the steps are the rounds of
+# propagation (see Solver.solve) and only the steps, seconds and memory
+# limits apply.
+def provePropositional(axioms, formula, budget=None):
+  meter = Meter(budget)
+  solver = Solver()
+  encoder = Encoder(solver)
+  for axiom in axioms:
+    encoder.require(axiom, frozenset([axiom]))
+  encoder.require(formula, frozenset(), False)
+  satisfiable = solver.solve(meter)
+  if satisfiable is None:
+    result = meter.result(UNKNOWN, solver.stopped)
+  elif satisfiable:
+    result = meter.result(UNPROVABLE)
+    values = solver.model()
+    result.counterexample = { atom: values[variable]
+      for variable, atom in encoder.atoms.items() }
+  else:
+    result = meter.result(PROVEN, used=solver.core)
+  result.stats.update({
+    'frontier': None,
+    'rounds': solver.restarts + 1,
+    'decisions': solver.decisions,
+    'conflicts': solver.conflicts,
+    'sat': True
+  })
+  return result
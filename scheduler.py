@@ -0,0 +1,106 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+from collections import deque
+import heapq
+
+##############################################################################
+# Frontier schedulers
+##############################################################################
+
+# A scheduler holds the frontier of sequents waiting to be expanded. push
+# and pop are O(1) for FIFO and O(log n) for the priority policies. Closed
+# sibling groups are not removed from the frontier; the prover skips their
+# sequents when they are popped.
+
+class FifoScheduler:
+  def __init__(self):
+    self.queue = deque()
+
+  def __len__(self):
+    return len(self.queue)
+
+  def push(self, sequent):
+    self.queue.append(sequent)
+
+  def pop(self):
+    if len(self.queue) == 0:
+      return None
+    return self.queue.popleft()
+
+# A priority scheduler pops the sequent with the smallest key, ties broken
+# by age. To stay complete it is fair: every `fairness` pops it takes the
+# oldest waiting sequent instead, so no sequent is starved forever.
+class PriorityScheduler:
+  def __init__(self, key, fairness=8):
+    self.key = key
+    self.fairness = fairness
+    self.heap = []
+    self.queue = deque()
+    self.counter = 0
+    self.pops = 0
+    self.size = 0
+
+  def __len__(self):
+    return self.size
+
+  def push(self, sequent):
+    # entries are [key, counter, sequent, taken] and are shared between the
+    # heap and the queue; an entry taken from one is skipped in the other
+    entry = [self.key(sequent), self.counter, sequent, False]
+    self.counter += 1
+    heapq.heappush(self.heap, entry)
+    self.queue.append(entry)
+    self.size += 1
+
+  def pop(self):
+    if self.size == 0:
+      return None
+    self.pops += 1
+    if self.pops % self.fairness == 0:
+      entry = self.queue.popleft()
+      while entry[3]:
+        entry = self.queue.popleft()
+    else:
+      entry = heapq.heappop(self.heap)
+      while entry[3]:
+        entry = heapq.heappop(self.heap)
+    entry[3] = True
+    self.size -= 1
+    return entry[2]
+
+def sequentSize(sequent):
+  return len(sequent.left) + len(sequent.right)
+
+def sequentUnificationTerms(sequent):
+  return len(sequent.unification_terms)
+
+# sibling groups are numbered in the order they are first seen (each group
+# is kept alive here so its id cannot be reused by a later group)
+class GroupAge:
+  def __init__(self):
+    self.groups = { }
+
+  def __call__(self, sequent):
+    if sequent.siblings is None:
+      return 0
+    age = self.groups.get(id(sequent.siblings))
+    if age is None:
+      age = (len(self.groups) + 1, sequent.siblings)
+      self.groups[id(sequent.siblings)] = age
+    return age[0]
+
+SCHEDULERS = {
+  'fifo': lambda: FifoScheduler(),
+  'smallest': lambda: PriorityScheduler(sequentSize),
+  'fewest-unification-terms':
+    lambda: PriorityScheduler(sequentUnificationTerms),
+  'oldest-group': lambda: PriorityScheduler(GroupAge()),
+}
+
+def makeScheduler(policy):
+  if policy not in SCHEDULERS:
+    raise ValueError('Unknown scheduling policy: %s.' % policy)
+  return SCHEDULERS[policy]()
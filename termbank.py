@@ -0,0 +1,314 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+from array import array
+from weakref import WeakValueDictionary
+from language import *
+from language import _hashName, _unchanged
+
+##############################################################################
+# Term bank
+##############################################################################
+
+# node kinds
+VARIABLE = 0
+UNIFICATION_TERM = 1
+FUNCTION = 2
+PREDICATE = 3
+
+# A term bank stores terms and atomic formulae as integer ids into flat
+# arrays (kind, symbol, arity, child offset, instantiation time and hash)
+# instead of one Python object per node. Nodes are hash-consed through an
+# open-addressing table that is itself an array of ids, so identical terms
+# get the same id. The classes below are thin views over an id; they
+# subclass the language classes, so the prover works on either
+# representation unchanged. Views are only kept alive while something
+# references them, and the children of a view are not materialized until
+# they are asked for.
+#
+# The arrays take about 44 bytes per node, against several hundred for
+# interned objects, so the bank is compact for storing terms. It does not
+# make a proof smaller, though: the prover works on views, and it creates
+# one (with its free variable summaries) for every atom and term it
+# touches. A view carries the slots of the class it subclasses as well as
+# its own, so it is a little larger than the object it stands for, and
+# while a proof runs the bank uses somewhat more memory than the object
+# representation.
+class TermBank:
+  def __init__(self):
+    self.kinds = array('b')
+    self.symbols = array('i')
+    self.arities = array('i')
+    self.offsets = array('i')
+    self.times = array('i')
+    self.hashes = array('q')
+    self.arguments = array('i')
+    self.table = array('i', [-1]) * 64
+    self.names = [ ]
+    self.symbol_ids = { }
+    self.views = WeakValueDictionary()
+
+  def __len__(self):
+    return len(self.kinds)
+
+  # bytes used by the node arrays and the table (symbol names are not
+  # included)
+  def arrayBytes(self):
+    return sum([
+      column.itemsize * len(column) for column in (
+        self.kinds, self.symbols, self.arities, self.offsets, self.times,
+        self.hashes, self.arguments, self.table
+      )
+    ])
+
+  def symbol(self, name):
+    symbol = self.symbol_ids.get(name)
+    if symbol is None:
+      symbol = len(self.names)
+      self.names.append(name)
+      self.symbol_ids[name] = symbol
+    return symbol
+
+  def children(self, node):
+    offset = self.offsets[node]
+    return self.arguments[offset:offset + self.arities[node]]
+
+  # find the table index holding a node, or the empty index where it belongs
+  def probe(self, hash_value, kind, symbol, time, children):
+    mask = len(self.table) - 1
+    index = hash_value & mask
+    while True:
+      node = self.table[index]
+      if node == -1:
+        return index
+      if self.hashes[node] == hash_value and self.kinds[node] == kind and \
+        self.symbols[node] == symbol:
+        if children is None:
+          if self.times[node] == time:
+            return index
+        elif self.children(node).tolist() == children:
+          return index
+      index = (index + 1) & mask
+
+  # find or create a leaf (a variable or a unification term)
+  def leaf(self, kind, name, time):
+    symbol = self.symbol(name)
+    hash_value = hash((kind + 1, _hashName(name), time))
+    index = self.probe(hash_value, kind, symbol, time, None)
+    node = self.table[index]
+    if node == -1:
+      node = self.append(index, kind, symbol, [], time, hash_value)
+    return node
+
+  # find or create a function or predicate application
+  def application(self, kind, name, children):
+    symbol = self.symbol(name)
+    hash_value = hash((kind + 1, _hashName(name)) +
+      tuple([self.hashes[child] for child in children]))
+    index = self.probe(hash_value, kind, symbol, None, children)
+    node = self.table[index]
+    if node == -1:
+      time = 0
+      if kind == FUNCTION:
+        time = max([self.times[child] for child in children], default=0)
+      node = self.append(index, kind, symbol, children, time, hash_value)
+    return node
+
+  def append(self, index, kind, symbol, children, time, hash_value):
+    node = len(self.kinds)
+    self.kinds.append(kind)
+    self.symbols.append(symbol)
+    self.arities.append(len(children))
+    self.offsets.append(len(self.arguments))
+    self.arguments.extend(children)
+    self.times.append(time)
+    self.hashes.append(hash_value)
+    self.table[index] = node
+    if 2 * len(self.kinds) > len(self.table):
+      self.grow()
+    return node
+
+  # double the table and reinsert every node
+  def grow(self):
+    self.table = array('i', [-1]) * (2 * len(self.table))
+    mask = len(self.table) - 1
+    for node in range(len(self.kinds)):
+      index = self.hashes[node] & mask
+      while self.table[index] != -1:
+        index = (index + 1) & mask
+      self.table[index] = node
+
+  # get the canonical view of a node
+  def view(self, node):
+    result = self.views.get(node)
+    if result is None:
+      result = object.__new__(VIEW_CLASSES[self.kinds[node]])
+      object.__setattr__(result, 'bank', self)
+      object.__setattr__(result, 'id', node)
+      object.__setattr__(result, 'summaries', None)
+      self.views[node] = result
+    return result
+
+  # get the id of a term or atomic formula, adding it if necessary
+  def intern(self, term):
+    if isinstance(term, BankView) and term.bank is self:
+      return term.id
+    if isinstance(term, Variable):
+      return self.leaf(VARIABLE, term.name, term.time)
+    if isinstance(term, UnificationTerm):
+      return self.leaf(UNIFICATION_TERM, term.name, term.time)
+    if isinstance(term, Function):
+      return self.application(FUNCTION, term.name,
+        [self.intern(subterm) for subterm in term.terms])
+    if isinstance(term, Predicate):
+      return self.application(PREDICATE, term.name,
+        [self.intern(subterm) for subterm in term.terms])
+    raise TypeError('Not a term or atomic formula: %s.' % term)
+
+  # like intern, but only finds existing nodes
+  def find(self, term):
+    if isinstance(term, BankView):
+      return term.id if term.bank is self else None
+    symbol = self.symbol_ids.get(term.name)
+    if symbol is None:
+      return None
+    if isinstance(term, Variable) or isinstance(term, UnificationTerm):
+      kind = VARIABLE if isinstance(term, Variable) else UNIFICATION_TERM
+      index = self.probe(hash((kind + 1, _hashName(term.name), term.time)),
+        kind, symbol, term.time, None)
+    else:
+      kind = FUNCTION if isinstance(term, Function) else PREDICATE
+      children = [self.find(subterm) for subterm in term.terms]
+      if None in children:
+        return None
+      index = self.probe(hash((kind + 1, _hashName(term.name)) +
+        tuple([self.hashes[child] for child in children])),
+        kind, symbol, None, children)
+    node = self.table[index]
+    return None if node == -1 else node
+
+  # copy a formula into the bank, so its atoms become views
+  def load(self, formula):
+    if isinstance(formula, (Variable, UnificationTerm, Function, Predicate)):
+      return self.view(self.intern(formula))
+    if isinstance(formula, Not):
+      return Not(self.load(formula.formula))
+    if isinstance(formula, And):
+      return And(self.load(formula.formula_a), self.load(formula.formula_b))
+    if isinstance(formula, Or):
+      return Or(self.load(formula.formula_a), self.load(formula.formula_b))
+    if isinstance(formula, Implies):
+      return Implies(self.load(formula.formula_a),
+        self.load(formula.formula_b))
+    if isinstance(formula, ForAll):
+      return ForAll(self.load(formula.variable), self.load(formula.formula))
+    if isinstance(formula, ThereExists):
+      return ThereExists(self.load(formula.variable),
+        self.load(formula.formula))
+    raise TypeError('Not a formula: %s.' % formula)
+
+  def replace(self, node, old, new):
+    if node == old:
+      return new
+    kind = self.kinds[node]
+    if kind == VARIABLE or kind == UNIFICATION_TERM:
+      return node
+    children = self.children(node).tolist()
+    replaced = [self.replace(child, old, new) for child in children]
+    if replaced == children:
+      return node
+    return self.application(kind, self.names[self.symbols[node]], replaced)
+
+  # collect the ids of the leaves of the given kind below a node
+  def leaves(self, node, kind, result):
+    node_kind = self.kinds[node]
+    if node_kind == kind:
+      result.add(node)
+    elif node_kind == FUNCTION or node_kind == PREDICATE:
+      for child in self.children(node):
+        self.leaves(child, kind, result)
+    return result
+
+##############################################################################
+# Views
+##############################################################################
+
+class BankView:
+  __slots__ = ()
+
+  @property
+  def name(self):
+    return self.bank.names[self.bank.symbols[self.id]]
+
+  @property
+  def hash(self):
+    return self.bank.hashes[self.id]
+
+  @property
+  def free_variables(self):
+    return self.getSummaries()[0]
+
+  @property
+  def free_unification_terms(self):
+    return self.getSummaries()[1]
+
+  # summaries are computed on first use and live as long as the view
+  def getSummaries(self):
+    if self.summaries is None:
+      bank = self.bank
+      object.__setattr__(self, 'summaries', (
+        frozenset([bank.view(node) for node in
+          bank.leaves(self.id, VARIABLE, set())]),
+        frozenset([bank.view(node) for node in
+          bank.leaves(self.id, UNIFICATION_TERM, set())])
+      ))
+    return self.summaries
+
+  def replace(self, old, new):
+    if self == old:
+      return new
+    old_id = self.bank.find(old)
+    if old_id is None or _unchanged(self, self.bank.view(old_id)):
+      return self
+    return self.bank.view(
+      self.bank.replace(self.id, old_id, self.bank.intern(new))
+    )
+
+class BankVariable(BankView, Variable):
+  __slots__ = ('bank', 'id', 'summaries')
+
+  @property
+  def time(self):
+    return self.bank.times[self.id]
+
+class BankUnificationTerm(BankView, UnificationTerm):
+  __slots__ = ('bank', 'id', 'summaries')
+
+  @property
+  def time(self):
+    return self.bank.times[self.id]
+
+class BankFunction(BankView, Function):
+  __slots__ = ('bank', 'id', 'summaries')
+
+  @property
+  def terms(self):
+    return tuple([self.bank.view(child)
+      for child in self.bank.children(self.id)])
+
+  @property
+  def time(self):
+    return self.bank.times[self.id]
+
+class BankPredicate(BankView, Predicate):
+  __slots__ = ('bank', 'id', 'summaries')
+
+  @property
+  def terms(self):
+    return tuple([self.bank.view(child)
+      for child in self.bank.children(self.id)])
+
+VIEW_CLASSES = [BankVariable, BankUnificationTerm, BankFunction,
+  BankPredicate]
@@ -0,0 +1,176 @@
+#!/usr/bin/python -O
+# -*- coding: utf-8 -*-
+
+# 2014 Stephan Boyer
+
+from language import *
+
+##############################################################################
+# Proof tracing
+##############################################################################
+
+# The prover reports each step to a tracer: a sequent taken from the
+# frontier, a rule applied to one of its formulae, and a sequent (with its
+# siblings) closed either axiomatically or by a unifier. The tracers differ
+# in how much they keep:
+#
+#   NullTracer       nothing (the default)
+#   CountingTracer   counters only
+#   RecordingTracer  a compact list of events, rendered on demand
+#   TextTracer       the proof printed as it is found
+#   BufferTracer     the steps themselves, to be passed on to another tracer
+#                    later (or dropped)
+#
+# Nothing is converted to text until render() is called (or, for a
+# TextTracer, until the step happens).
+
+class NullTracer:
+  def sequent(self, sequent):
+    pass
+
+  def rule(self, sequent, side, formula):
+    pass
+
+  def axiom(self, sequent):
+    pass
+
+  def unified(self, sequent, unifier):
+    pass
+
+  def render(self):
+    return ''
+
+# the text of a sequent with the given formulae on each side
+def sequentText(left, right):
+  left_part = ', '.join([str(formula) for formula in left])
+  right_part = ', '.join([str(formula) for formula in right])
+  if left_part != '':
+    left_part = left_part + ' '
+  if right_part != '':
+    right_part = ' ' + right_part
+  return left_part + '⊢' + right_part
+
+# the name of a rule, e.g. ForAll-left
+def ruleName(side, formula):
+  return '%s-%s' % (type(formula).__name__, side)
+
+class CountingTracer(NullTracer):
+  def __init__(self):
+    self.sequents = 0
+    self.axioms = 0
+    self.unifications = 0
+    self.rules = { }
+
+  def sequent(self, sequent):
+    self.sequents += 1
+
+  def rule(self, sequent, side, formula):
+    name = ruleName(side, formula)
+    self.rules[name] = self.rules.get(name, 0) + 1
+
+  def axiom(self, sequent):
+    self.axioms += 1
+
+  def unified(self, sequent, unifier):
+    self.unifications += 1
+
+  def render(self):
+    lines = ['sequents: %d' % self.sequents,
+      'axiomatic closures: %d' % self.axioms,
+      'unifier closures: %d' % self.unifications]
+    for name in sorted(self.rules):
+      lines.append('%s: %d' % (name, self.rules[name]))
+    return '\n'.join(lines)
+
+# event kinds
+SEQUENT = 0
+RULE = 1
+AXIOM = 2
+UNIFIED = 3
+
+# Events are tuples whose second field is the id of the sequent they are
+# about (its position in the order sequents were taken from the frontier).
+# Only what render() needs is kept: the depth and the sides of each sequent,
+# the formula each rule was applied to, and the bindings of each closing
+# unifier. The sides are the sequent's persistent maps, which are shared
+# with the proof, so recording a step takes constant time and does not keep
+# the sequents themselves (or their indexes, pairs and siblings) alive. The
+# bindings are recorded as the unifier made them (each one may mention
+# other bound terms) and only resolved into a substitution by render().
+class RecordingTracer(NullTracer):
+  def __init__(self):
+    self.count = 0
+    self.events = []
+
+  def sequent(self, sequent):
+    self.events.append((SEQUENT, self.count, sequent.depth, sequent.left,
+      sequent.right))
+    self.count += 1
+
+  def rule(self, sequent, side, formula):
+    self.events.append((RULE, self.count - 1, side, formula))
+
+  def axiom(self, sequent):
+    self.events.append((AXIOM, self.count - 1))
+
+  def unified(self, sequent, unifier):
+    self.events.append((UNIFIED, self.count - 1,
+      tuple([(term, unifier.bindings[term]) for term in unifier.trail])))
+
+  # the proof as text; with rules=True each applied rule is shown as well
+  def render(self, rules=False):
+    lines = []
+    for event in self.events:
+      if event[0] == SEQUENT:
+        lines.append('%s. %s' % (event[2],
+          sequentText(event[3], event[4])))
+      elif event[0] == RULE:
+        if rules:
+          lines.append('  by %s on %s' % (ruleName(event[2], event[3]),
+            event[3]))
+      elif event[0] == UNIFIED:
+        bindings = dict(event[2])
+        for k, v in event[2]:
+          lines.append('  %s = %s' % (k, applyBindings(v, bindings)))
+    return '\n'.join(lines)
+
+# a term with the bindings applied until no bound unification term is left
+def applyBindings(term, bindings):
+  while isinstance(term, UnificationTerm) and term in bindings:
+    term = bindings[term]
+  if isinstance(term, Function) and not term.isGround():
+    return Function(term.name, [applyBindings(subterm, bindings)
+      for subterm in term.terms])
+  return term
+
+class TextTracer(NullTracer):
+  def sequent(self, sequent):
+    print('%s. %s' % (sequent.depth, sequent))
+
+  def unified(self, sequent, unifier):
+    for k, v in unifier.substitution().items():
+      print('  %s = %s' % (k, v))
+
+# A buffer tracer holds on to the steps of a search whose trace is only
+# wanted if the search turns out well, and replays them to another tracer.
+# It keeps the sequents and unifiers themselves, so it is only meant for a
+# search with a budget.
+class BufferTracer(NullTracer):
+  def __init__(self):
+    self.calls = []
+
+  def sequent(self, sequent):
+    self.calls.append(('sequent', (sequent,)))
+
+  def rule(self, sequent, side, formula):
+    self.calls.append(('rule', (sequent, side, formula)))
+
+  def axiom(self, sequent):
+    self.calls.append(('axiom', (sequent,)))
+
+  def unified(self, sequent, unifier):
+    self.calls.append(('unified', (sequent, unifier)))
+
+  def replay(self, tracer):
+    for name, arguments in self.calls:
+      getattr(tracer, name)(*arguments)